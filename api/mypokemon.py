@@ -1,47 +1,43 @@
 # mypokemon.py
 from http.server import BaseHTTPRequestHandler
-import json
 import urllib.parse
-import hashlib
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-from datetime import datetime, timezone, timedelta
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, reads
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
-def get_time_until_reset():
-    """Calculate time until 12am UTC"""
-    utc_now = datetime.now(timezone.utc)
-    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    time_until = tomorrow - utc_now
-    hours = int(time_until.total_seconds() // 3600)
-    minutes = int((time_until.total_seconds() % 3600) // 60)
-    seconds = int(time_until.total_seconds() % 60)
-    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+# Cached type table. Built off to the side and swapped in with a single
+# assignment, so a request never sees a half-built cache.
+CACHE = None
+REFERENCE_SECTIONS = ['pokemon_data']
 
-def get_pokemon_type(pokemon_name):
-    """Get Pokemon type from Firestore"""
-    try:
-        doc = db.collection('pokemon_data').document(pokemon_name).get()
-        if doc.exists:
-            return doc.to_dict().get('type', 'Unknown')
-        return 'Unknown'
-    except:
-        return 'Unknown'
+def build_cache(data):
+    """Build the species -> type table from reference data"""
+    return {
+        'reference': data,
+        'types': {name: info.get('type', 'Unknown') for name, info in data['pokemon_data'].items()}
+    }
 
-class handler(BaseHTTPRequestHandler):
+# Shared reference cache layout (game/core.py); CACHE is its current tables
+REFERENCE_CACHE = core.new_reference_cache(REFERENCE_SECTIONS, build_cache)
+
+def get_pokemon_types(pokemon_list):
+    """Get types for a team from the reference data, re-checked on a TTL"""
+    global CACHE
+    CACHE = core.load_reference_cache(REFERENCE_CACHE)
+    types = CACHE['types'] if CACHE else {}
+    return [types.get(p, 'Unknown') for p in pokemon_list]
+
+@instrument.traced('mypokemon')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -58,15 +54,16 @@ class handler(BaseHTTPRequestHandler):
             # Check if user is a moderator
             if user_level in ['owner', 'moderator']:
                 # Moderator offline play - show daily team
-                utc_now = datetime.now(timezone.utc)
-                daily_id = f"mod_daily_{utc_now.strftime('%Y%m%d')}"
+                daily_id = core.mod_daily_id()
                 
                 try:
                     # Get mod's daily Pokemon
-                    catch_doc = db.collection('mod_daily').document(daily_id).collection('users').document(user).get()
+                    catch_ref = db.collection('mod_daily').document(daily_id).collection('users').document(user)
+                    battle_ref = db.collection('mod_daily_battles').document(daily_id).collection('users').document(user)
+                    data, battle_data = reads.get_documents(db, [catch_ref, battle_ref])
                     
-                    if not catch_doc.exists:
-                        response = f"@{user}, you haven't caught any Pokemon today! Use !pokecatch to get started! | {get_time_until_reset()}"
+                    if data is None:
+                        response = f"@{user}, you haven't caught any Pokemon today! Use !pokecatch to get started! | {core.get_time_until_reset()}"
                         self.send_response(200)
                         self.send_header('Content-type', 'text/plain')
                         self.send_header('Access-Control-Allow-Origin', '*')
@@ -74,16 +71,12 @@ class handler(BaseHTTPRequestHandler):
                         self.wfile.write(response.encode())
                         return
                     
-                    data = catch_doc.to_dict()
                     pokemon_list = data.get('pokemon', [])
                     levels = data.get('levels', [])
                     training_used = data.get('training_used', 0)
                     
                     # Get daily battle record
-                    battle_doc = db.collection('mod_daily_battles').document(daily_id).collection('users').document(user).get()
-                    
-                    if battle_doc.exists:
-                        battle_data = battle_doc.to_dict()
+                    if battle_data:
                         wins = battle_data.get('wins', 0)
                         losses = battle_data.get('losses', 0)
                         battles_done = battle_data.get('battles', 0)
@@ -94,13 +87,12 @@ class handler(BaseHTTPRequestHandler):
                     battles_left = 2 - battles_done
                     training_left = 2 - training_used
                     
-                    # Format Pokemon with types and levels - get types from Firestore
+                    # Format Pokemon with types and levels - types from cache or one batched read
                     pokemon_with_info = []
-                    for p, l in zip(pokemon_list, levels):
-                        ptype = get_pokemon_type(p)
+                    for p, l, ptype in zip(pokemon_list, levels, get_pokemon_types(pokemon_list)):
                         pokemon_with_info.append(f"{p} ({ptype}, Lv.{l})")
                     
-                    response = f"@{user}'s team: {', '.join(pokemon_with_info)} | Record: {wins}W-{losses}L | Battles left: {battles_left} | Training left: {training_left} | {get_time_until_reset()}"
+                    response = f"@{user}'s team: {', '.join(pokemon_with_info)} | Record: {wins}W-{losses}L | Battles left: {battles_left} | Training left: {training_left} | {core.get_time_until_reset()}"
                     
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain')
@@ -126,13 +118,15 @@ class handler(BaseHTTPRequestHandler):
             return
         
         # ONLINE PLAY - Regular stream logic
-        stream_id = hashlib.md5(f"{channel}_{uptime}".encode()).hexdigest()
+        stream_id = core.stream_id(channel, uptime)
         
         try:
             # Get user's Pokemon for current stream
-            catch_doc = db.collection('catches').document(stream_id).collection('users').document(user).get()
+            catch_ref = db.collection('catches').document(stream_id).collection('users').document(user)
+            battle_ref = db.collection('stream_battles').document(stream_id).collection('users').document(user)
+            data, battle_data = reads.get_documents(db, [catch_ref, battle_ref])
             
-            if not catch_doc.exists:
+            if data is None:
                 response = f"@{user}, you haven't caught any Pokemon this stream! Use !pokecatch to get started!"
                 self.send_response(200)
                 self.send_header('Content-type', 'text/plain')
@@ -141,16 +135,12 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response.encode())
                 return
             
-            data = catch_doc.to_dict()
             pokemon_list = data.get('pokemon', [])
             levels = data.get('levels', [])
             training_used = data.get('training_used', 0)
             
             # Get battle record for this stream
-            battle_doc = db.collection('stream_battles').document(stream_id).collection('users').document(user).get()
-            
-            if battle_doc.exists:
-                battle_data = battle_doc.to_dict()
+            if battle_data:
                 wins = battle_data.get('wins', 0)
                 losses = battle_data.get('losses', 0)
                 battles_done = battle_data.get('battles', 0)
@@ -161,10 +151,9 @@ class handler(BaseHTTPRequestHandler):
             battles_left = 2 - battles_done
             training_left = 2 - training_used
             
-            # Format Pokemon with types and levels - get types from Firestore
+            # Format Pokemon with types and levels - types from cache or one batched read
             pokemon_with_info = []
-            for p, l in zip(pokemon_list, levels):
-                ptype = get_pokemon_type(p)
+            for p, l, ptype in zip(pokemon_list, levels, get_pokemon_types(pokemon_list)):
                 pokemon_with_info.append(f"{p} ({ptype}, Lv.{l})")
             
             response = f"@{user}'s team: {', '.join(pokemon_with_info)} | Record: {wins}W-{losses}L | Battles left: {battles_left} | Training left: {training_left}"
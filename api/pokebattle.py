@@ -1,109 +1,81 @@
 # pokebattle.py
 from http.server import BaseHTTPRequestHandler
-import json
 import urllib.parse
 import random
-import hashlib
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-from datetime import datetime, timezone, timedelta
+from firebase_admin import firestore
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import battle, core, httpcache, instrument, pool, rankings, reads
+from game.battle import LEVEL_POWER_RATE, LEVEL_POWER_CAP, TYPE_BONUS, RANDOM_POWER
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
-# Cache for Pokemon data
-POKEMON_CACHE = {}
-TYPE_ADVANTAGES_CACHE = {}
-LEGENDARIES_CACHE = []
-CACHE_LOADED = False
+# Cache for Pokemon data. Built off to the side and swapped in with a single
+# assignment, so a request never sees a half-built cache.
+CACHE = None
+REFERENCE_SECTIONS = ['pokemon_data', 'type_advantages', 'legendaries']
+
+def build_cache(data):
+    """Build the battle cache (species and type tables) from reference data"""
+    tables = battle.build_battle_tables(data)
+    return {
+        'reference': data,
+        'species': tables['species'],
+        'types': tables['types']
+    }
+
+# Shared reference cache layout (game/core.py); CACHE is its current tables
+REFERENCE_CACHE = core.new_reference_cache(REFERENCE_SECTIONS, build_cache)
 
 def load_battle_data():
-    """Load Pokemon data and type advantages from Firestore"""
-    global POKEMON_CACHE, TYPE_ADVANTAGES_CACHE, LEGENDARIES_CACHE, CACHE_LOADED
-    
-    if CACHE_LOADED:
-        return True
-    
-    try:
-        # Load type advantages
-        type_doc = db.collection('game_config').document('type_advantages').get()
-        if type_doc.exists:
-            TYPE_ADVANTAGES_CACHE = type_doc.to_dict().get('data', {})
-        
-        # Load legendaries
-        legends_doc = db.collection('game_config').document('legendaries').get()
-        if legends_doc.exists:
-            LEGENDARIES_CACHE = legends_doc.to_dict().get('list', [])
-        
-        # Load all Pokemon data
-        pokemon_docs = db.collection('pokemon_data').stream()
-        for doc in pokemon_docs:
-            POKEMON_CACHE[doc.id] = doc.to_dict()
-        
-        CACHE_LOADED = True
-        return True
-    except:
-        return False
+    """Load Pokemon data and type advantages into cache, re-checking versions on a TTL"""
+    global CACHE
+    CACHE = core.load_reference_cache(REFERENCE_CACHE)
+    return CACHE is not None
 
-def get_time_until_reset():
-    """Calculate time until 12am UTC"""
-    utc_now = datetime.now(timezone.utc)
-    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    time_until = tomorrow - utc_now
-    hours = int(time_until.total_seconds() // 3600)
-    minutes = int((time_until.total_seconds() % 3600) // 60)
-    seconds = int(time_until.total_seconds() % 60)
-    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+def species_id(pokemon_name):
+    """Look up a species' id in the power and type tables"""
+    species = CACHE['species']
+    return species['index'].get(pokemon_name, species['unknown_id'])
 
 def calculate_power(pokemon_name, level):
     """Calculate battle power with balanced scoring"""
-    power = 0
-    
-    # Base power from level (capped at 5 points max)
-    power += min(level * 0.1, 5)
-    
-    # Legendary bonus (reduced from 10 to 5 for balance)
-    if pokemon_name in LEGENDARIES_CACHE:
-        power += 5
+    # Level power (capped) plus the precomputed stage and legendary bonuses
+    return min(level * LEVEL_POWER_RATE, LEVEL_POWER_CAP) + CACHE['species']['base_power'][species_id(pokemon_name)]
+
+def battle_round(id1, power1, id2, power2):
+    """Resolve one round from species ids and their precomputed power scores"""
+    # Type advantages - one matrix lookup each way
+    types = CACHE['types']
+    combo1 = types['species_combo'][id1]
+    combo2 = types['species_combo'][id2]
+    power1 += types['matchup'][combo1][combo2] * TYPE_BONUS
+    power2 += types['matchup'][combo2][combo1] * TYPE_BONUS
     
-    # Evolution stage (2-6 points)
-    stage = POKEMON_CACHE.get(pokemon_name, {}).get('stage', 1)
-    power += stage * 2
+    # Random factor
+    power1 += random.random() * RANDOM_POWER
+    power2 += random.random() * RANDOM_POWER
     
-    return power
+    return 1 if power1 > power2 else 2
 
 def battle_pokemon(poke1, level1, poke2, level2):
     """Determine winner with balanced type advantages and power scores"""
-    power1 = calculate_power(poke1, level1)
-    power2 = calculate_power(poke2, level2)
-    
-    # Type advantages (increased to 2.0 from 1.5)
-    types1 = POKEMON_CACHE.get(poke1, {}).get('type', 'Normal').split('/')
-    types2 = POKEMON_CACHE.get(poke2, {}).get('type', 'Normal').split('/')
-    
-    for type1 in types1:
-        for type2 in types2:
-            if type2 in TYPE_ADVANTAGES_CACHE.get(type1, []):
-                power1 += 2.0
-            if type1 in TYPE_ADVANTAGES_CACHE.get(type2, []):
-                power2 += 2.0
-    
-    # Random factor (increased to 0-3 from 0-2)
-    power1 += random.random() * 3
-    power2 += random.random() * 3
-    
-    return 1 if power1 > power2 else 2
+    return battle_round(
+        species_id(poke1), calculate_power(poke1, level1),
+        species_id(poke2), calculate_power(poke2, level2)
+    )
 
 def sort_by_power(pokemon_list, levels_list):
-    """Sort Pokemon by power score from weakest to strongest"""
+    """Sort Pokemon by power score from weakest to strongest
+    
+    Returns (name, level, power, species id) tuples.
+    """
+    base_power = CACHE['species']['base_power']
     pokemon_with_power = []
-    for i in range(len(pokemon_list)):
-        power = calculate_power(pokemon_list[i], levels_list[i])
-        pokemon_with_power.append((pokemon_list[i], levels_list[i], power))
+    for pokemon, level in zip(pokemon_list, levels_list):
+        sid = species_id(pokemon)
+        power = min(level * LEVEL_POWER_RATE, LEVEL_POWER_CAP) + base_power[sid]
+        pokemon_with_power.append((pokemon, level, power, sid))
     
     # Sort by power (weakest first)
     pokemon_with_power.sort(key=lambda x: x[2])
@@ -121,9 +93,10 @@ def full_team_battle(user_pokemon, user_levels, opp_pokemon, opp_levels, user, o
     opp_wins = 0
     
     for i in range(5):
-        round_winner = battle_pokemon(
-            user_sorted[i][0], user_sorted[i][1],
-            opp_sorted[i][0], opp_sorted[i][1]
+        # Reuse the ids and powers computed for sorting
+        round_winner = battle_round(
+            user_sorted[i][3], user_sorted[i][2],
+            opp_sorted[i][3], opp_sorted[i][2]
         )
         
         if round_winner == 1:
@@ -142,14 +115,97 @@ def full_team_battle(user_pokemon, user_levels, opp_pokemon, opp_levels, user, o
     
     return overall_winner, results, user_wins, opp_wins
 
-class handler(BaseHTTPRequestHandler):
+MAX_BATTLES = 2
+MAX_POOL_PICKS = 3  # stale pool entries tolerated before falling back to a scan
+
+def rebuild_opponent_pool(pool_parent, users_ref):
+    """Scan a stream/day's catches and rewrite its available-opponents pool"""
+    available = {}
+    for doc in users_ref.stream():
+        doc_data = doc.to_dict()
+        if doc_data.get('battles_used', 0) < MAX_BATTLES:
+            available[doc.id] = doc_data
+    pool.replace(db, pool_parent, list(available))
+    return available
+
+@instrument.phase('find_opponent')
+def find_random_opponent(pool_parent, users_ref, user):
+    """Pick a random opponent with battles left from the available-opponents pool
+    
+    Normally one round trip for every pool shard plus one catch read. The pick
+    is uniform over the whole pool, however unevenly it's spread over shards.
+    Returns (opponent, data) or (None, None).
+    """
+    snapshots = reads.get_snapshots(db, pool.shard_refs(pool_parent))
+    candidates = [u for u in pool.members(snapshots) if u != user]
+    
+    if any(snapshot.exists for snapshot in snapshots):
+        stale = []
+        for _ in range(MAX_POOL_PICKS):
+            if not candidates:
+                break
+            opponent = candidates.pop(random.randrange(len(candidates)))
+            opp_doc = users_ref.document(opponent).get()
+            if opp_doc.exists:
+                opp_data = opp_doc.to_dict()
+                if opp_data.get('battles_used', 0) < MAX_BATTLES:
+                    if stale:
+                        batch = db.batch()
+                        pool.queue_leave(batch, pool_parent, stale)
+                        batch.commit()
+                    return opponent, opp_data
+            stale.append(opponent)
+        
+        if not candidates and not stale:
+            return None, None
+    
+    # No pool yet (stream started before it existed) or too many stale entries
+    available = rebuild_opponent_pool(pool_parent, users_ref)
+    available.pop(user, None)
+    if not available:
+        return None, None
+    opponent = random.choice(list(available))
+    return opponent, available[opponent]
+
+def exhausted_players(players):
+    """Names whose battle count (after this battle) uses up their battles"""
+    return [name for name, battles_used in players if battles_used >= MAX_BATTLES]
+
+@instrument.phase('record_battle')
+def record_battle(day_or_stream_ref, user, battles_used, opponent, opp_battles_used, winner, update_stats):
+    """Commit every write a battle makes in one batch using server-side increments
+    
+    Bumps both trainers' battles_used, drops anyone now out of battles from the
+    opponent pool and, for stream battles, increments leaderboard and legends
+    without reading them first, so concurrent battles can't lose updates. The
+    same batch queues both trainers for the top lists and the !pokerank index,
+    which the standings commands catch up on, so a battle is one commit.
+    """
+    users_ref = day_or_stream_ref.collection('users')
+    batch = db.batch()
+    batch.update(users_ref.document(user), {'battles_used': firestore.Increment(1)})
+    batch.update(users_ref.document(opponent), {'battles_used': firestore.Increment(1)})
+    
+    # Players out of battles drop out of the opponent pool
+    exhausted = exhausted_players([(user, battles_used + 1), (opponent, opp_battles_used + 1)])
+    if exhausted:
+        pool.queue_leave(batch, day_or_stream_ref, exhausted)
+    
+    if update_stats:
+        # Resettable leaderboard plus the permanent legends collection
+        rankings.record_results(db, batch, {user: winner == 1, opponent: winner == 2})
+    
+    batch.commit()
+
+@instrument.traced('pokebattle')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain; charset=utf-8')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -176,15 +232,14 @@ class handler(BaseHTTPRequestHandler):
             # Check if user is a moderator
             if user_level in ['owner', 'moderator']:
                 # Moderator offline play - daily battles
-                utc_now = datetime.now(timezone.utc)
-                daily_id = f"mod_daily_{utc_now.strftime('%Y%m%d')}"
+                daily_id = core.mod_daily_id()
                 
                 try:
                     # Get user's Pokemon from mod_daily
                     user_catch = db.collection('mod_daily').document(daily_id).collection('users').document(user).get()
                     
                     if not user_catch.exists:
-                        response = f"@{user}, you haven't caught any Pokemon today! Use !pokecatch first! | {get_time_until_reset()}"
+                        response = f"@{user}, you haven't caught any Pokemon today! Use !pokecatch first! | {core.get_time_until_reset()}"
                         self.send_response(200)
                         self.send_header('Content-type', 'text/plain; charset=utf-8')
                         self.send_header('Access-Control-Allow-Origin', '*')
@@ -199,8 +254,8 @@ class handler(BaseHTTPRequestHandler):
                     # Check daily battle limit (using separate counter)
                     battles_used = user_data.get('battles_used', 0)
                     
-                    if battles_used >= 2:
-                        response = f"@{user}, you've battled twice today! Wait for the daily reset! | {get_time_until_reset()}"
+                    if battles_used >= MAX_BATTLES:
+                        response = f"@{user}, you've battled twice today! Wait for the daily reset! | {core.get_time_until_reset()}"
                         self.send_response(200)
                         self.send_header('Content-type', 'text/plain; charset=utf-8')
                         self.send_header('Access-Control-Allow-Origin', '*')
@@ -212,7 +267,7 @@ class handler(BaseHTTPRequestHandler):
                     if target and target.lower() != 'random':
                         target = target.lower().replace('@', '')
                         if target == user:
-                            response = f"@{user}, you can't battle yourself! | {get_time_until_reset()}"
+                            response = f"@{user}, you can't battle yourself! | {core.get_time_until_reset()}"
                             self.send_response(200)
                             self.send_header('Content-type', 'text/plain; charset=utf-8')
                             self.send_header('Access-Control-Allow-Origin', '*')
@@ -223,7 +278,7 @@ class handler(BaseHTTPRequestHandler):
                         opp_catch = db.collection('mod_daily').document(daily_id).collection('users').document(target).get()
                         
                         if not opp_catch.exists:
-                            response = f"@{user}, {target} hasn't caught any Pokemon today! | {get_time_until_reset()}"
+                            response = f"@{user}, {target} hasn't caught any Pokemon today! | {core.get_time_until_reset()}"
                             self.send_response(200)
                             self.send_header('Content-type', 'text/plain; charset=utf-8')
                             self.send_header('Access-Control-Allow-Origin', '*')
@@ -234,24 +289,21 @@ class handler(BaseHTTPRequestHandler):
                         opponent = target
                         opp_data = opp_catch.to_dict()
                     else:
-                        # Find random opponent from mod_daily
-                        all_catches = db.collection('mod_daily').document(daily_id).collection('users').stream()
-                        potential_opponents = []
-                        
-                        for doc in all_catches:
-                            if doc.id != user:
-                                potential_opponents.append((doc.id, doc.to_dict()))
+                        # Find random opponent from the mod_daily opponent pool
+                        opponent, opp_data = find_random_opponent(
+                            db.collection('mod_daily').document(daily_id),
+                            db.collection('mod_daily').document(daily_id).collection('users'),
+                            user
+                        )
                         
-                        if not potential_opponents:
-                            response = f"@{user}, no opponents available in offline mode! | {get_time_until_reset()}"
+                        if not opponent:
+                            response = f"@{user}, no opponents available in offline mode! | {core.get_time_until_reset()}"
                             self.send_response(200)
                             self.send_header('Content-type', 'text/plain; charset=utf-8')
                             self.send_header('Access-Control-Allow-Origin', '*')
                             self.end_headers()
                             self.wfile.write(response.encode('utf-8'))
                             return
-                        
-                        opponent, opp_data = random.choice(potential_opponents)
                     
                     opp_pokemon = opp_data.get('pokemon', [])
                     opp_levels = opp_data.get('levels', [])
@@ -263,17 +315,13 @@ class handler(BaseHTTPRequestHandler):
                         user, opponent
                     )
                     
-                    # Update battle count for user
-                    user_catch_ref = db.collection('mod_daily').document(daily_id).collection('users').document(user)
-                    user_catch_ref.update({
-                        'battles_used': battles_used + 1
-                    })
-                    
-                    # Update battle count for opponent (ALWAYS - targeted or random)
-                    opp_catch_ref = db.collection('mod_daily').document(daily_id).collection('users').document(opponent)
-                    opp_catch_ref.update({
-                        'battles_used': opp_data.get('battles_used', 0) + 1
-                    })
+                    # Battle counts and opponent pool in one commit (no leaderboard offline)
+                    record_battle(
+                        db.collection('mod_daily').document(daily_id),
+                        user, battles_used,
+                        opponent, opp_data.get('battles_used', 0),
+                        winner, update_stats=False
+                    )
                     
                     # Format response with countdown
                     if winner == 1:
@@ -285,7 +333,7 @@ class handler(BaseHTTPRequestHandler):
                     
                     battles_left = 1 - battles_used
                     battle_text = " | ".join(battle_results)
-                    response = f"⚔️ BATTLE: {battle_text} | {emoji} {user} {result} to {opponent}! ({battles_left} battle{'s' if battles_left != 1 else ''} left) | {get_time_until_reset()}"
+                    response = f"⚔️ BATTLE: {battle_text} | {emoji} {user} {result} to {opponent}! ({battles_left} battle{'s' if battles_left != 1 else ''} left) | {core.get_time_until_reset()}"
                     
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain; charset=utf-8')
@@ -310,7 +358,7 @@ class handler(BaseHTTPRequestHandler):
             return
         
         # ONLINE PLAY - Regular stream logic
-        stream_id = hashlib.md5(f"{channel}_{uptime}".encode()).hexdigest()
+        stream_id = core.stream_id(channel, uptime)
         
         try:
             # Get user's Pokemon
@@ -332,7 +380,7 @@ class handler(BaseHTTPRequestHandler):
             # Check battle limit (using separate counter)
             battles_used = user_data.get('battles_used', 0)
             
-            if battles_used >= 2:
+            if battles_used >= MAX_BATTLES:
                 response = f"@{user}, you've battled twice this stream! Wait for the next stream!"
                 self.send_response(200)
                 self.send_header('Content-type', 'text/plain; charset=utf-8')
@@ -367,7 +415,7 @@ class handler(BaseHTTPRequestHandler):
                 # Check if target has battles left
                 opp_data = opp_catch.to_dict()
                 opp_battles = opp_data.get('battles_used', 0)
-                if opp_battles >= 2:
+                if opp_battles >= MAX_BATTLES:
                     response = f"@{user}, {target} is too tired to battle (already battled twice)! Try someone else!"
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain; charset=utf-8')
@@ -378,17 +426,14 @@ class handler(BaseHTTPRequestHandler):
                 
                 opponent = target
             else:
-                # Find random opponent
-                all_catches = db.collection('catches').document(stream_id).collection('users').stream()
-                potential_opponents = []
+                # Find random opponent from the stream's opponent pool
+                opponent, opp_data = find_random_opponent(
+                    db.collection('catches').document(stream_id),
+                    db.collection('catches').document(stream_id).collection('users'),
+                    user
+                )
                 
-                for doc in all_catches:
-                    if doc.id != user:
-                        doc_data = doc.to_dict()
-                        if doc_data.get('battles_used', 0) < 2:
-                            potential_opponents.append((doc.id, doc_data))
-                
-                if not potential_opponents:
+                if not opponent:
                     response = f"@{user}, no opponents available! Encourage others to !pokecatch!"
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain; charset=utf-8')
@@ -396,8 +441,6 @@ class handler(BaseHTTPRequestHandler):
                     self.end_headers()
                     self.wfile.write(response.encode('utf-8'))
                     return
-                
-                opponent, opp_data = random.choice(potential_opponents)
             
             opp_pokemon = opp_data.get('pokemon', [])
             opp_levels = opp_data.get('levels', [])
@@ -409,101 +452,13 @@ class handler(BaseHTTPRequestHandler):
                 user, opponent
             )
             
-            # Update battle count for user
-            user_catch_ref = db.collection('catches').document(stream_id).collection('users').document(user)
-            user_catch_ref.update({
-                'battles_used': battles_used + 1
-            })
-            
-            # Update battle count for opponent (ALWAYS - targeted or random)
-            opp_catch_ref = db.collection('catches').document(stream_id).collection('users').document(opponent)
-            opp_catch_ref.update({
-                'battles_used': opp_data.get('battles_used', 0) + 1
-            })
-            
-            # Update leaderboard for user
-            leaderboard_ref = db.collection('leaderboard').document(user)
-            leaderboard_doc = leaderboard_ref.get()
-            
-            if leaderboard_doc.exists:
-                lb_data = leaderboard_doc.to_dict()
-                lb_data['total_battles'] = lb_data.get('total_battles', 0) + 1
-                if winner == 1:
-                    lb_data['total_wins'] = lb_data.get('total_wins', 0) + 1
-                else:
-                    lb_data['total_losses'] = lb_data.get('total_losses', 0) + 1
-            else:
-                lb_data = {
-                    'total_battles': 1,
-                    'total_wins': 1 if winner == 1 else 0,
-                    'total_losses': 1 if winner == 2 else 0
-                }
-            
-            lb_data['last_battle'] = firestore.SERVER_TIMESTAMP
-            leaderboard_ref.set(lb_data)
-            
-            # Update leaderboard for opponent (ALWAYS - targeted or random)
-            opp_leaderboard_ref = db.collection('leaderboard').document(opponent)
-            opp_leaderboard_doc = opp_leaderboard_ref.get()
-            
-            if opp_leaderboard_doc.exists:
-                opp_lb_data = opp_leaderboard_doc.to_dict()
-                opp_lb_data['total_battles'] = opp_lb_data.get('total_battles', 0) + 1
-                if winner == 2:
-                    opp_lb_data['total_wins'] = opp_lb_data.get('total_wins', 0) + 1
-                else:
-                    opp_lb_data['total_losses'] = opp_lb_data.get('total_losses', 0) + 1
-            else:
-                opp_lb_data = {
-                    'total_battles': 1,
-                    'total_wins': 1 if winner == 2 else 0,
-                    'total_losses': 1 if winner == 1 else 0
-                }
-            
-            opp_lb_data['last_battle'] = firestore.SERVER_TIMESTAMP
-            opp_leaderboard_ref.set(opp_lb_data)
-            
-            # Also update legends collection for user
-            legends_ref = db.collection('legends').document(user)
-            legends_doc = legends_ref.get()
-            
-            if legends_doc.exists:
-                legend_data = legends_doc.to_dict()
-                legend_data['total_battles'] = legend_data.get('total_battles', 0) + 1
-                if winner == 1:
-                    legend_data['total_wins'] = legend_data.get('total_wins', 0) + 1
-                else:
-                    legend_data['total_losses'] = legend_data.get('total_losses', 0) + 1
-            else:
-                legend_data = {
-                    'total_battles': 1,
-                    'total_wins': 1 if winner == 1 else 0,
-                    'total_losses': 1 if winner == 2 else 0
-                }
-            
-            legend_data['last_battle'] = firestore.SERVER_TIMESTAMP
-            legends_ref.set(legend_data)
-            
-            # Update legends for opponent (ALWAYS - targeted or random)
-            opp_legends_ref = db.collection('legends').document(opponent)
-            opp_legends_doc = opp_legends_ref.get()
-            
-            if opp_legends_doc.exists:
-                opp_legend_data = opp_legends_doc.to_dict()
-                opp_legend_data['total_battles'] = opp_legend_data.get('total_battles', 0) + 1
-                if winner == 2:
-                    opp_legend_data['total_wins'] = opp_legend_data.get('total_wins', 0) + 1
-                else:
-                    opp_legend_data['total_losses'] = opp_legend_data.get('total_losses', 0) + 1
-            else:
-                opp_legend_data = {
-                    'total_battles': 1,
-                    'total_wins': 1 if winner == 2 else 0,
-                    'total_losses': 1 if winner == 1 else 0
-                }
-            
-            opp_legend_data['last_battle'] = firestore.SERVER_TIMESTAMP
-            opp_legends_ref.set(opp_legend_data)
+            # Battle counts, opponent pool, leaderboard and legends in one commit
+            record_battle(
+                db.collection('catches').document(stream_id),
+                user, battles_used,
+                opponent, opp_data.get('battles_used', 0),
+                winner, update_stats=True
+            )
             
             # Format response
             if winner == 1:
@@ -1,91 +1,118 @@
 # pokecatch.py
 from http.server import BaseHTTPRequestHandler
-import json
+import logging
 import urllib.parse
-import random
-import hashlib
-import os
-from datetime import datetime, timezone, timedelta
 
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, pool, spawn
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
-# Cache for Pokemon data
-POKEMON_CACHE = {}
-LEGENDARIES_CACHE = []
-CACHE_LOADED = False
+# Cache for Pokemon data. Built off to the side and swapped in with a single
+# assignment, so a request never sees a half-built cache.
+CACHE = None
+REFERENCE_SECTIONS = ['pokemon_data', 'legendaries', 'spawn_weights']
 
-def load_pokemon_data():
-    """Load Pokemon data from Firestore into cache"""
-    global POKEMON_CACHE, LEGENDARIES_CACHE, CACHE_LOADED
-    
-    if CACHE_LOADED:
-        return True
-    
-    try:
-        # Load legendary list
-        legends_doc = db.collection('game_config').document('legendaries').get()
-        if legends_doc.exists:
-            LEGENDARIES_CACHE = legends_doc.to_dict().get('list', [])
-        
-        # Load all Pokemon data
-        pokemon_docs = db.collection('pokemon_data').stream()
-        for doc in pokemon_docs:
-            POKEMON_CACHE[doc.id] = doc.to_dict()
-        
-        CACHE_LOADED = True
-        return True
-    except:
-        return False
+MAX_CATCH_ATTEMPTS = 5
+MAX_JOIN_ATTEMPTS = 3
+
+log = logging.getLogger(__name__)
 
-def get_time_until_reset():
-    """Calculate time until 12am UTC"""
-    utc_now = datetime.now(timezone.utc)
-    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    time_until = tomorrow - utc_now
-    hours = int(time_until.total_seconds() // 3600)
-    minutes = int((time_until.total_seconds() % 3600) // 60)
-    seconds = int(time_until.total_seconds() % 60)
-    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+def build_cache(data):
+    """Build the catch cache (species, legendaries, spawn table) from reference data"""
+    pokemon_data = data['pokemon_data']
+    legendaries = data['game_config']['legendaries'].get('list', [])
+    spawn_config = data['game_config']['spawn_weights']
+    return {
+        'reference': data,
+        'pokemon': pokemon_data,
+        'legendaries': legendaries,
+        'spawn_table': spawn.build_spawn_table(pokemon_data, legendaries, spawn_config)
+    }
+
+# Shared reference cache layout (game/core.py); CACHE is its current tables
+REFERENCE_CACHE = core.new_reference_cache(REFERENCE_SECTIONS, build_cache)
+
+def load_pokemon_data():
+    """Load Pokemon data into cache, re-checking game_config/versions on a TTL"""
+    global CACHE
+    CACHE = core.load_reference_cache(REFERENCE_CACHE)
+    return CACHE is not None
 
 def catch_pokemon():
     """Generate 5 random Pokemon with levels"""
-    caught = []
-    levels = []
+    return spawn.roll_team(CACHE['spawn_table'], 5)
+
+def join_pool(catch_ref):
+    """Add a first-time catcher to their stream/day's pokebattle opponent pool
+    
+    Kept out of the catch commit so a raid's first catches don't contend on the
+    pool. The ArrayUnion is idempotent, so a failed write is simply retried; if
+    every attempt fails the catch still stands, but the trainer can only be
+    battled by name until the pool is next rebuilt.
+    """
+    for _ in range(MAX_JOIN_ATTEMPTS):
+        try:
+            pool.join(catch_ref.parent.parent, catch_ref.id)
+            return
+        except Exception:
+            log.exception("Adding %s to the opponent pool failed", catch_ref.id)
+
+@instrument.phase('catch')
+def run_catch(catch_ref):
+    """Advance the catch state machine (first catch -> re-roll -> locked) atomically
     
-    all_pokemon = list(POKEMON_CACHE.keys())
-    non_legendaries = [p for p in all_pokemon if p not in LEGENDARIES_CACHE]
+    Reads the catch doc, then writes conditionally: a first catch is a create()
+    (fails if another click created it first), a re-roll an update guarded by
+    the doc's last_update_time. A lost race re-reads and tries again. Each state
+    costs what a plain read-then-write does - one read when locked - and a team
+    is only rolled when it's written.
     
-    for _ in range(5):
-        if LEGENDARIES_CACHE and random.random() < 0.03:  # 3% legendary chance
-            pokemon = random.choice(LEGENDARIES_CACHE)
-            level = random.randint(40, 50)
-        else:
-            pokemon = random.choice(non_legendaries if non_legendaries else all_pokemon)
-            poke_info = POKEMON_CACHE.get(pokemon, {})
-            min_level = poke_info.get('catch_level_min', 5)
-            max_level = poke_info.get('catch_level_max', 45)
-            level = random.randint(min_level, max_level)
+    Returns (previous catch_count, pokemon, levels).
+    """
+    for _ in range(MAX_CATCH_ATTEMPTS):
+        snapshot = catch_ref.get()
+        data = snapshot.to_dict() if snapshot.exists else {}
+        catch_count = data.get('catch_count', 0)
+        
+        if catch_count >= 2:
+            # Re-roll already used - nothing to write
+            return catch_count, data.get('pokemon', []), data.get('levels', [])
         
-        caught.append(pokemon)
-        levels.append(level)
+        caught, levels = catch_pokemon()
+        catch_data = {
+            'pokemon': caught,
+            'levels': levels,
+            'catch_count': catch_count + 1,
+            'caught_at': firestore.SERVER_TIMESTAMP
+        }
+        try:
+            if snapshot.exists:
+                # Keep battles_used / training_used on re-roll
+                catch_ref.update(catch_data, option=db.write_option(last_update_time=snapshot.update_time))
+            else:
+                catch_ref.create(catch_data)
+        except (AlreadyExists, FailedPrecondition):
+            # Another !pokecatch from the same trainer got there first - re-read
+            continue
+        if catch_count == 0:
+            join_pool(catch_ref)
+        return catch_count, caught, levels
     
-    return caught, levels
+    raise RuntimeError("Too much contention catching")
 
-class handler(BaseHTTPRequestHandler):
+@instrument.traced('pokecatch')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -111,60 +138,19 @@ class handler(BaseHTTPRequestHandler):
             # Check if user is a moderator
             if user_level in ['owner', 'moderator']:
                 # Moderator offline play - daily limit
-                utc_now = datetime.now(timezone.utc)
-                daily_id = f"mod_daily_{utc_now.strftime('%Y%m%d')}"
+                daily_id = core.mod_daily_id()
                 
                 try:
                     catch_ref = db.collection('mod_daily').document(daily_id).collection('users').document(user)
-                    catch_doc = catch_ref.get()
+                    catch_count, pokemon_list, levels = run_catch(catch_ref)
+                    pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
                     
-                    if catch_doc.exists:
-                        data = catch_doc.to_dict()
-                        catch_count = data.get('catch_count', 0)
-                        
-                        if catch_count == 1:
-                            # First catch done, DO the re-roll
-                            caught, levels = catch_pokemon()
-                            
-                            catch_ref.update({
-                                'pokemon': caught,
-                                'levels': levels,
-                                'catch_count': 2,
-                                'caught_at': firestore.SERVER_TIMESTAMP
-                            })
-                            
-                            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
-                            response = f"@{user} RE-ROLLED and caught: {', '.join(pokemon_with_levels)}! (Re-roll used) | {get_time_until_reset()}"
-                        elif catch_count >= 2:
-                            # Already used both catches
-                            pokemon_list = data.get('pokemon', [])
-                            levels = data.get('levels', [])
-                            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
-                            response = f"@{user}, you already caught: {', '.join(pokemon_with_levels)}! (Re-roll used) | {get_time_until_reset()}"
-                        else:
-                            # catch_count = 0, shouldn't happen but handle it
-                            caught, levels = catch_pokemon()
-                            catch_ref.set({
-                                'pokemon': caught,
-                                'levels': levels,
-                                'catch_count': 1,
-                                'caught_at': firestore.SERVER_TIMESTAMP
-                            })
-                            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
-                            response = f"@{user} caught: {', '.join(pokemon_with_levels)}! You can re-roll your team once by using !pokecatch again! | {get_time_until_reset()}"
+                    if catch_count == 1:
+                        response = f"@{user} RE-ROLLED and caught: {', '.join(pokemon_with_levels)}! (Re-roll used) | {core.get_time_until_reset()}"
+                    elif catch_count >= 2:
+                        response = f"@{user}, you already caught: {', '.join(pokemon_with_levels)}! (Re-roll used) | {core.get_time_until_reset()}"
                     else:
-                        # First catch of the day
-                        caught, levels = catch_pokemon()
-                        
-                        catch_ref.set({
-                            'pokemon': caught,
-                            'levels': levels,
-                            'catch_count': 1,
-                            'caught_at': firestore.SERVER_TIMESTAMP
-                        })
-                        
-                        pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
-                        response = f"@{user} caught: {', '.join(pokemon_with_levels)}! You can re-roll your team once by using !pokecatch again! | {get_time_until_reset()}"
+                        response = f"@{user} caught: {', '.join(pokemon_with_levels)}! You can re-roll your team once by using !pokecatch again! | {core.get_time_until_reset()}"
                     
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain')
@@ -189,58 +175,18 @@ class handler(BaseHTTPRequestHandler):
             return
         
         # ONLINE PLAY - Regular stream logic
-        stream_id = hashlib.md5(f"{channel}_{uptime}".encode()).hexdigest()
+        stream_id = core.stream_id(channel, uptime)
         
         try:
             catch_ref = db.collection('catches').document(stream_id).collection('users').document(user)
-            catch_doc = catch_ref.get()
+            catch_count, pokemon_list, levels = run_catch(catch_ref)
+            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
             
-            if catch_doc.exists:
-                data = catch_doc.to_dict()
-                catch_count = data.get('catch_count', 0)
-                
-                if catch_count == 1:
-                    # First catch done, DO the re-roll directly
-                    caught, levels = catch_pokemon()
-                    
-                    catch_ref.update({
-                        'pokemon': caught,
-                        'levels': levels,
-                        'catch_count': 2,
-                        'caught_at': firestore.SERVER_TIMESTAMP
-                    })
-                    
-                    pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
-                    response = f"@{user}, you RE-ROLLED and caught: {', '.join(pokemon_with_levels)}! (Re-roll used)"
-                elif catch_count >= 2:
-                    # Already used both catches
-                    pokemon_list = data.get('pokemon', [])
-                    levels = data.get('levels', [])
-                    pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
-                    response = f"@{user}, you already caught: {', '.join(pokemon_with_levels)}! (Re-roll used)"
-                else:
-                    # catch_count = 0, shouldn't happen but handle it
-                    caught, levels = catch_pokemon()
-                    catch_ref.set({
-                        'pokemon': caught,
-                        'levels': levels,
-                        'catch_count': 1,
-                        'caught_at': firestore.SERVER_TIMESTAMP
-                    })
-                    pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
-                    response = f"@{user} caught: {', '.join(pokemon_with_levels)}! You can re-roll your team once by using !pokecatch again!"
+            if catch_count == 1:
+                response = f"@{user}, you RE-ROLLED and caught: {', '.join(pokemon_with_levels)}! (Re-roll used)"
+            elif catch_count >= 2:
+                response = f"@{user}, you already caught: {', '.join(pokemon_with_levels)}! (Re-roll used)"
             else:
-                # First catch this stream
-                caught, levels = catch_pokemon()
-                
-                catch_ref.set({
-                    'pokemon': caught,
-                    'levels': levels,
-                    'catch_count': 1,
-                    'caught_at': firestore.SERVER_TIMESTAMP
-                })
-                
-                pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(caught, levels)]
                 response = f"@{user} caught: {', '.join(pokemon_with_levels)}! You can re-roll your team once by using !pokecatch again!"
             
             self.send_response(200)
@@ -2,71 +2,92 @@
 from http.server import BaseHTTPRequestHandler
 import urllib.parse
 import random
-import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-from datetime import datetime, timezone, timedelta
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, names, ttlcache
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
-def get_time_until_reset():
-    """Calculate time until 12am UTC"""
-    utc_now = datetime.now(timezone.utc)
-    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    time_until = tomorrow - utc_now
-    hours = int(time_until.total_seconds() // 3600)
-    minutes = int((time_until.total_seconds() % 3600) // 60)
-    seconds = int(time_until.total_seconds() % 60)
-    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+# Species data and name index. Built off to the side and swapped in with a
+# single assignment, so a request never sees a half-built cache.
+CACHE = None
+REFERENCE_SECTIONS = ['pokemon_data']
+
+# Resolved lookups (match or suggestion) by normalized query, dropped whenever
+# the species data changes
+LOOKUP_TTL = 300  # seconds
+LOOKUP_CACHE = ttlcache.new_cache(LOOKUP_TTL)
+
+def build_cache(data):
+    """Build the pokedex cache (species data, name index, id list) from reference data"""
+    return {
+        'reference': data,
+        'pokemon': data['pokemon_data'],
+        'names': names.build_name_index(data['pokemon_data']),
+        'ids': list(data['pokemon_data'])  # for O(1) random picks
+    }
+
+# Shared reference cache layout (game/core.py); CACHE is its current tables
+REFERENCE_CACHE = core.new_reference_cache(REFERENCE_SECTIONS, build_cache)
+
+def load_pokedex_data():
+    """Load Pokemon data into cache, re-checking game_config/versions on a TTL"""
+    global CACHE
+    cache = core.load_reference_cache(REFERENCE_CACHE)
+    if cache is not CACHE:
+        # New species data - drop lookups resolved against the old one
+        ttlcache.invalidate(LOOKUP_CACHE)
+    CACHE = cache
+    return CACHE is not None
+
+def resolve_lookup(pokemon_name):
+    """Species id a query resolves to, or (None, closest suggestion) for a miss"""
+    name = names.lookup_name(CACHE['names'], CACHE['pokemon'], pokemon_name)
+    if name:
+        return name, None
+    return None, names.suggest_name(CACHE['names'], pokemon_name)
+
+def cached_lookup(pokemon_name):
+    """resolve_lookup through the per-instance lookup cache"""
+    key = (pokemon_name.strip().title(), names.normalize_name(pokemon_name))
+    return ttlcache.get_or_compute(LOOKUP_CACHE, key, lambda: resolve_lookup(pokemon_name))
 
 def get_pokemon_info(pokemon_name):
-    """Get Pokemon info from Firestore using normalized search"""
-    try:
-        # First try exact match with title case
-        doc = db.collection('pokemon_data').document(pokemon_name.strip().title()).get()
-        if doc.exists:
-            return doc.id, doc.to_dict()  # Return both name and data
-        
-        # If not found, try normalized search
-        normalized = ''.join(c.lower() for c in pokemon_name if c.isalnum())
-        
-        # Query by normalized_name field
-        docs = db.collection('pokemon_data').where('normalized_name', '==', normalized).limit(1).get()
-        
-        if docs:
-            doc = docs[0]
-            return doc.id, doc.to_dict()  # Return document ID (proper name) and data
-            
-    except:
-        pass
+    """Get Pokemon info from the in-memory index using normalized search"""
+    name, _ = cached_lookup(pokemon_name)
+    if name:
+        return name, CACHE['pokemon'][name]  # Return both name and data
     return None, None
 
+def suggest_pokemon(pokemon_name):
+    """Suggest the closest Pokemon name for a lookup that missed"""
+    _, suggestion = cached_lookup(pokemon_name)
+    return suggestion
+
+def not_found_message(user, pokemon_param):
+    """Not-found reply, with a suggestion when a close name exists"""
+    suggestion = suggest_pokemon(pokemon_param)
+    if suggestion:
+        return f"@{user}, {pokemon_param} not found in the Pokedex! Did you mean {suggestion}?"
+    return f"@{user}, {pokemon_param} not found in the Pokedex!"
+
 def get_random_pokemon():
-    """Get a random Pokemon from Firestore"""
-    try:
-        # Get all Pokemon documents
-        docs = db.collection('pokemon_data').limit(1000).get()
-        if docs:
-            # Pick a random one
-            random_doc = random.choice(docs)
-            return random_doc.id, random_doc.to_dict()
-    except:
-        pass
+    """Get a random Pokemon from the cached species ids"""
+    species_ids = CACHE['ids']
+    if species_ids:
+        pokemon_name = random.choice(species_ids)
+        return pokemon_name, CACHE['pokemon'][pokemon_name]
     return None, None
 
-class handler(BaseHTTPRequestHandler):
+@instrument.traced('pokedex')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain; charset=utf-8')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -83,6 +104,16 @@ class handler(BaseHTTPRequestHandler):
         is_offline = not uptime or uptime.lower() == 'offline'
         is_mod = user_level in ['owner', 'moderator']
         
+        # Load Pokemon data and name index - not needed for the offline message
+        # regular viewers get
+        if (is_mod or not is_offline) and not load_pokedex_data():
+            self.send_response(500)
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(b"Error: Could not load Pokedex data from database.")
+            return
+        
         if is_offline:
             if is_mod:
                 # Moderator can use pokedex offline
@@ -98,16 +129,16 @@ class handler(BaseHTTPRequestHandler):
                                 entry = info.get('entry', 'No data available.')
                                 
                                 # Ensure total message stays under 500 chars
-                                total_msg = f"📖 Random Pokemon: {pokemon_name} ({ptype}) - {entry} | {get_time_until_reset()}"
+                                total_msg = f"📖 Random Pokemon: {pokemon_name} ({ptype}) - {entry} | {core.get_time_until_reset()}"
                                 if len(total_msg) > 490:
                                     # Calculate how much to trim from entry
                                     excess = len(total_msg) - 487
                                     entry = entry[:len(entry) - excess] + "..."
-                                    total_msg = f"📖 Random Pokemon: {pokemon_name} ({ptype}) - {entry} | {get_time_until_reset()}"
+                                    total_msg = f"📖 Random Pokemon: {pokemon_name} ({ptype}) - {entry} | {core.get_time_until_reset()}"
                                 
                                 response = total_msg
                             else:
-                                response = f"Pokedex database error! | {get_time_until_reset()}"
+                                response = f"Pokedex database error! | {core.get_time_until_reset()}"
                         else:
                             # Specific Pokemon lookup with normalized search
                             pokemon_name, info = get_pokemon_info(pokemon_param)
@@ -119,17 +150,17 @@ class handler(BaseHTTPRequestHandler):
                                 evolution_chain = info.get('evolution', 'No evolution')
                                 
                                 # Build message and truncate if needed
-                                response = f"📖 {pokemon_name} ({ptype}) - {species} | Evolution: {evolution_chain} | {entry} | {get_time_until_reset()}"
+                                response = f"📖 {pokemon_name} ({ptype}) - {species} | Evolution: {evolution_chain} | {entry} | {core.get_time_until_reset()}"
                                 if len(response) > 490:
                                     # Calculate how much we need to trim from entry
                                     excess = len(response) - 487
                                     entry = entry[:len(entry) - excess] + "..."
-                                    response = f"📖 {pokemon_name} ({ptype}) - {species} | Evolution: {evolution_chain} | {entry} | {get_time_until_reset()}"
+                                    response = f"📖 {pokemon_name} ({ptype}) - {species} | Evolution: {evolution_chain} | {entry} | {core.get_time_until_reset()}"
                             else:
-                                response = f"@{user}, {pokemon_param} not found in the Pokedex! | {get_time_until_reset()}"
+                                response = f"{not_found_message(user, pokemon_param)} | {core.get_time_until_reset()}"
                     else:
                         # No parameter provided (shouldn't happen with new command)
-                        response = f"@{user}, please specify a Pokemon name or 'random'! | {get_time_until_reset()}"
+                        response = f"@{user}, please specify a Pokemon name or 'random'! | {core.get_time_until_reset()}"
                     
                     self.send_response(200)
                     self.send_header('Content-type', 'text/plain; charset=utf-8')
@@ -195,7 +226,7 @@ class handler(BaseHTTPRequestHandler):
                                 entry = entry[:len(entry) - excess] + "..."
                                 response = f"📖 {pokemon_name} ({ptype}) - {species} | Evolution: {evolution_chain} | {entry}"
                         else:
-                            response = f"@{user}, {pokemon_param} not found in the Pokedex!"
+                            response = not_found_message(user, pokemon_param)
                 else:
                     # No parameter provided (shouldn't happen with new command)
                     response = f"@{user}, please specify a Pokemon name or 'random'!"
@@ -1,27 +1,25 @@
 # pokeleaderclear.py
 from http.server import BaseHTTPRequestHandler
 import urllib.parse
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import os
+import time
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import bulk, core, httpcache, instrument, rankings, seasons
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
 ALLOWED_USERS = ['jennetdaria', 'itssjonn']
+CLEAR_JOB = 'leaderboard_clear'
 
-class handler(BaseHTTPRequestHandler):
+@instrument.traced('pokeleaderclear')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization first
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -42,17 +40,35 @@ class handler(BaseHTTPRequestHandler):
             return
         
         try:
-            # Delete all leaderboard entries
-            batch = db.batch()
-            docs = db.collection('leaderboard').stream()
-            count = 0
-            for doc in docs:
-                batch.delete(doc.reference)
-                count += 1
+            deadline = time.monotonic() + bulk.TIME_BUDGET
+            progress_ref = bulk.progress_ref(db, CLEAR_JOB)
             
-            if count > 0:
-                batch.commit()
-                response = f"🔄 Pokemon leaderboard cleared and reset! {count} trainers removed."
+            # Archive the season before anything is deleted. The first run of a
+            # clear picks the season id; later runs continue its archive
+            _, archived, archive_done = seasons.archive_leaderboard(db, progress_ref, deadline)
+            if not archive_done:
+                response = f"⏳ Archiving the season... {archived} trainers saved so far. Run !pokeleaderclear again to continue."
+                self.send_response(200)
+                self.send_header('Content-type', 'text/plain')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(response.encode())
+                return
+            
+            # Empty the materialized top list first so nobody sees half-cleared ranks
+            rankings.rankings_ref(db, 'leaderboard').set({'entries': []})
+            
+            # Delete leaderboard entries in parallel chunks; a big leaderboard may
+            # take a few runs, each picking up where the last one stopped
+            time_left = deadline - time.monotonic()
+            count, done = bulk.delete_collection(db, db.collection('leaderboard'), CLEAR_JOB, time_budget=time_left)
+            
+            if not done:
+                response = f"⏳ Clearing the leaderboard... {count} trainers removed so far. Run !pokeleaderclear again to finish."
+            elif count > 0:
+                # Reset the !pokerank index from the now-empty leaderboard
+                rankings.rebuild_rank_index(db, 'leaderboard')
+                response = f"🔄 Pokemon leaderboard archived, cleared and reset! {count} trainers removed."
             else:
                 response = "Leaderboard was already empty!"
             
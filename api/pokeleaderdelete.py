@@ -1,27 +1,23 @@
 # pokeleaderdelete.py
 from http.server import BaseHTTPRequestHandler
 import urllib.parse
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import os
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, rankings, seasons
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
 ALLOWED_USERS = ['jennetdaria', 'itssjonn']
 
-class handler(BaseHTTPRequestHandler):
+@instrument.traced('pokeleaderdelete')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
         
         # SECURITY: Check channel authorization first
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -63,8 +59,16 @@ class handler(BaseHTTPRequestHandler):
                 wins = data.get('total_wins', 0)
                 losses = data.get('total_losses', 0)
                 
-                # Delete the document
-                doc_ref.delete()
+                # Delete the document, note it for the season archive and take
+                # it out of the !pokerank index
+                batch = db.batch()
+                batch.delete(doc_ref)
+                seasons.record_removal(batch, db, target, data)
+                if rankings.rank_index_ref(db, 'leaderboard').get().exists:
+                    rankings.queue_index_move(batch, db, 'leaderboard', rankings.indexed_key(data), None)
+                batch.commit()
+                # Take them out of the top list so the next trainer moves up
+                rankings.remove_from_rankings(db, 'leaderboard', target)
                 response = f"✅ @{target} has been removed from the leaderboard (was {wins}W-{losses}L)"
             else:
                 response = f"@{target} was not found on the leaderboard"
@@ -1,17 +1,69 @@
 # pokeleaders.py
+# Edge-cached for RESPONSE_TTL seconds (game/httpcache.py). The edge keys on the
+# full URL, so the chatbot command must call this with only channel and
+# season in the query string - no user, uptime or other per-call values.
 from http.server import BaseHTTPRequestHandler
 import urllib.parse
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import os
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, rankings, seasons, ttlcache
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
+RESPONSE_TTL = 5  # seconds
+
+# Rendered responses, shared by every request on this instance for a few seconds
+RESPONSE_CACHE = ttlcache.new_cache(RESPONSE_TTL)
+
+@instrument.phase('build_response')
+def build_leaders_response(last_season):
+    """Top 5 trainers (or last season's champions) as a chat message"""
+    if last_season:
+        # Copied out of the season archive by !pokeleaderclear
+        doc = seasons.last_season_ref(db).get()
+        all_trainers = doc.to_dict().get('entries', []) if doc.exists else []
+        title = "🏆 LAST SEASON'S CHAMPIONS: "
+        empty_message = "🏆 No season has been archived yet!"
+    else:
+        # Pre-ranked top trainers, after applying battles queued since the last look
+        rankings.catch_up(db)
+        all_trainers = rankings.load_rankings(db, 'leaderboard')
+        title = "🏆 TOP TRAINERS: "
+        empty_message = "🏆 No trainers on the leaderboard yet! Get battling!"
+    for trainer in all_trainers:
+        trainer['win_rate'] = rankings.win_rate(trainer)
+    
+    if not all_trainers:
+        response = empty_message
+    else:
+        # Format top 5 with proper ranking (accounting for ties)
+        leaders = []
+        current_rank = 1
+        prev_wins = None
+        prev_rate = None
+        
+        for i, trainer in enumerate(all_trainers[:10]):  # Get more to ensure we have 5 displayed
+            # Determine actual rank (accounting for ties)
+            if prev_wins != trainer['wins'] or prev_rate != trainer['win_rate']:
+                current_rank = i + 1
+            
+            # Only show top 5 ranks
+            if current_rank <= 5:
+                win_pct = int(trainer['win_rate'] * 100)
+                leaders.append(f"{current_rank}. {trainer['name']} ({trainer['wins']}W-{trainer['losses']}L, {win_pct}%)")
+            
+            prev_wins = trainer['wins']
+            prev_rate = trainer['win_rate']
+            
+            # Stop after we have 5 entries
+            if len(leaders) >= 5:
+                break
+        
+        response = title + " | ".join(leaders)
+    
+    return response
+
+@instrument.traced('pokeleaders')
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         # pokeleaders works for everyone but only in jennetdaria channel
@@ -19,69 +71,31 @@ class handler(BaseHTTPRequestHandler):
         params = urllib.parse.parse_qs(query)
         
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', httpcache.NO_STORE)
             self.end_headers()
             self.wfile.write(b"Unauthorized: This channel is not permitted to use this command.")
             return
         
+        # !pokeleaders last shows the champions of the last archived season
+        last_season = params.get('season', [''])[0].lower() == 'last'
+        
         try:
-            # Get all leaderboard entries
-            leaderboard_docs = db.collection('leaderboard').stream()
-            
-            all_trainers = []
-            for doc in leaderboard_docs:
-                data = doc.to_dict()
-                total_battles = data.get('total_battles', 0)
-                total_wins = data.get('total_wins', 0)
-                total_losses = data.get('total_losses', 0)
-                
-                if total_battles >= 5:  # Minimum 5 battles to qualify
-                    win_rate = total_wins / total_battles if total_battles > 0 else 0
-                    all_trainers.append({
-                        'name': doc.id,
-                        'wins': total_wins,
-                        'losses': total_losses,
-                        'battles': total_battles,
-                        'win_rate': win_rate
-                    })
+            # Served from memory for a few seconds; concurrent misses share one build
+            response = ttlcache.get_or_compute(RESPONSE_CACHE, 'last_season' if last_season else 'leaderboard', lambda: build_leaders_response(last_season))
             
-            if not all_trainers:
-                response = "🏆 No trainers on the leaderboard yet! Get battling!"
-            else:
-                # Sort by total wins first, then by win rate as tiebreaker
-                all_trainers.sort(key=lambda x: (x['wins'], x['win_rate']), reverse=True)
-                
-                # Format top 5 with proper ranking (accounting for ties)
-                leaders = []
-                current_rank = 1
-                prev_wins = None
-                prev_rate = None
-                
-                for i, trainer in enumerate(all_trainers[:10]):  # Get more to ensure we have 5 displayed
-                    # Determine actual rank (accounting for ties)
-                    if prev_wins != trainer['wins'] or prev_rate != trainer['win_rate']:
-                        current_rank = i + 1
-                    
-                    # Only show top 5 ranks
-                    if current_rank <= 5:
-                        win_pct = int(trainer['win_rate'] * 100)
-                        leaders.append(f"{current_rank}. {trainer['name']} ({trainer['wins']}W-{trainer['losses']}L, {win_pct}%)")
-                    
-                    prev_wins = trainer['wins']
-                    prev_rate = trainer['win_rate']
-                    
-                    # Stop after we have 5 entries
-                    if len(leaders) >= 5:
-                        break
-                
-                response = "🏆 TOP TRAINERS: " + " | ".join(leaders)
+            # The edge can serve this for RESPONSE_TTL seconds and revalidate by ETag
+            etag = httpcache.etag_for(response)
+            if httpcache.not_modified(self, RESPONSE_TTL, etag):
+                return
             
             self.send_response(200)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            httpcache.send_cache_headers(self, RESPONSE_TTL, etag)
             self.end_headers()
             self.wfile.write(response.encode())
             
@@ -89,5 +103,6 @@ class handler(BaseHTTPRequestHandler):
             self.send_response(500)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', httpcache.NO_STORE)
             self.end_headers()
             self.wfile.write(f"Error loading leaderboard!".encode())
@@ -1,17 +1,71 @@
 # pokelegends.py
+# Edge-cached for RESPONSE_TTL seconds (game/httpcache.py). The edge keys on the
+# full URL, so the chatbot command must call this with only channel in the
+# query string - no user, uptime or other per-call values.
 from http.server import BaseHTTPRequestHandler
 import urllib.parse
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import os
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, rankings, ttlcache
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
+RESPONSE_TTL = 5  # seconds
+
+# Rendered responses, shared by every request on this instance for a few seconds
+RESPONSE_CACHE = ttlcache.new_cache(RESPONSE_TTL)
+
+@instrument.phase('build_response')
+def build_legends_response():
+    """Top 5 legends as a chat message"""
+    # Pre-ranked legends, after applying battles queued since the last look
+    rankings.catch_up(db)
+    all_legends = rankings.load_rankings(db, 'legends')
+    for trainer in all_legends:
+        trainer['win_rate'] = rankings.win_rate(trainer)
+    
+    if not all_legends:
+        response = "⭐ LEGENDS HALL OF FAME: No legendary trainers yet! Battle more to become a legend!"
+    else:
+        # Format top 5 with proper ranking (accounting for ties)
+        legends = []
+        current_rank = 1
+        prev_wins = None
+        prev_rate = None
+        
+        for i, trainer in enumerate(all_legends[:10]):  # Get more to ensure we have 5 displayed
+            # Determine actual rank (accounting for ties)
+            if prev_wins != trainer['wins'] or prev_rate != trainer['win_rate']:
+                current_rank = i + 1
+            
+            # Only show top 5 ranks
+            if current_rank <= 5:
+                win_pct = int(trainer['win_rate'] * 100)
+                
+                # Add special emojis for top 3 actual ranks
+                if current_rank == 1:
+                    emoji = "👑"
+                elif current_rank == 2:
+                    emoji = "🥈"
+                elif current_rank == 3:
+                    emoji = "🥉"
+                else:
+                    emoji = f"{current_rank}."
+                
+                legends.append(f"{emoji} {trainer['name']} ({trainer['wins']}W-{trainer['losses']}L, {win_pct}%)")
+            
+            prev_wins = trainer['wins']
+            prev_rate = trainer['win_rate']
+            
+            # Stop after we have 5 entries
+            if len(legends) >= 5:
+                break
+        
+        response = "⭐ LEGENDS HALL OF FAME: " + " | ".join(legends)
+    
+    return response
+
+@instrument.traced('pokelegends')
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
@@ -19,80 +73,28 @@ class handler(BaseHTTPRequestHandler):
         
         # SECURITY: Check channel authorization
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', httpcache.NO_STORE)
             self.end_headers()
             self.wfile.write(b"Unauthorized: This channel is not permitted to use this command.")
             return
         
         try:
-            # Get all entries from the permanent legends collection
-            legends_docs = db.collection('legends').stream()
-            
-            all_legends = []
-            for doc in legends_docs:
-                data = doc.to_dict()
-                total_battles = data.get('total_battles', 0)
-                total_wins = data.get('total_wins', 0)
-                total_losses = data.get('total_losses', 0)
-                
-                if total_battles >= 10:  # Higher threshold for legends (10 battles minimum)
-                    win_rate = total_wins / total_battles if total_battles > 0 else 0
-                    all_legends.append({
-                        'name': doc.id,
-                        'wins': total_wins,
-                        'losses': total_losses,
-                        'battles': total_battles,
-                        'win_rate': win_rate
-                    })
+            # Served from memory for a few seconds; concurrent misses share one build
+            response = ttlcache.get_or_compute(RESPONSE_CACHE, 'legends', lambda: build_legends_response())
             
-            if not all_legends:
-                response = "⭐ LEGENDS HALL OF FAME: No legendary trainers yet! Battle more to become a legend!"
-            else:
-                # Sort by total wins first, then by win rate as tiebreaker
-                all_legends.sort(key=lambda x: (x['wins'], x['win_rate']), reverse=True)
-                
-                # Format top 5 with proper ranking (accounting for ties)
-                legends = []
-                current_rank = 1
-                prev_wins = None
-                prev_rate = None
-                
-                for i, trainer in enumerate(all_legends[:10]):  # Get more to ensure we have 5 displayed
-                    # Determine actual rank (accounting for ties)
-                    if prev_wins != trainer['wins'] or prev_rate != trainer['win_rate']:
-                        current_rank = i + 1
-                    
-                    # Only show top 5 ranks
-                    if current_rank <= 5:
-                        win_pct = int(trainer['win_rate'] * 100)
-                        
-                        # Add special emojis for top 3 actual ranks
-                        if current_rank == 1:
-                            emoji = "👑"
-                        elif current_rank == 2:
-                            emoji = "🥈"
-                        elif current_rank == 3:
-                            emoji = "🥉"
-                        else:
-                            emoji = f"{current_rank}."
-                        
-                        legends.append(f"{emoji} {trainer['name']} ({trainer['wins']}W-{trainer['losses']}L, {win_pct}%)")
-                    
-                    prev_wins = trainer['wins']
-                    prev_rate = trainer['win_rate']
-                    
-                    # Stop after we have 5 entries
-                    if len(legends) >= 5:
-                        break
-                
-                response = "⭐ LEGENDS HALL OF FAME: " + " | ".join(legends)
+            # The edge can serve this for RESPONSE_TTL seconds and revalidate by ETag
+            etag = httpcache.etag_for(response)
+            if httpcache.not_modified(self, RESPONSE_TTL, etag):
+                return
             
             self.send_response(200)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            httpcache.send_cache_headers(self, RESPONSE_TTL, etag)
             self.end_headers()
             self.wfile.write(response.encode())
             
@@ -100,5 +102,6 @@ class handler(BaseHTTPRequestHandler):
             self.send_response(500)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Cache-Control', httpcache.NO_STORE)
             self.end_headers()
             self.wfile.write(f"Error loading legends!".encode())
@@ -0,0 +1,67 @@
+# pokerank.py
+from http.server import BaseHTTPRequestHandler
+import urllib.parse
+
+from game import core, httpcache, instrument, rankings
+
+# Firestore client, created on first use
+db = core.db
+
+RANK_LABELS = {'leaderboard': "🏆 Leaderboard", 'legends': "⭐ Legends"}
+
+def format_standing(collection, standing):
+    """One collection's part of the !pokerank response"""
+    entry = standing['entry']
+    label = RANK_LABELS[collection]
+    if entry['battles'] < rankings.MIN_BATTLES[collection]:
+        return f"{label}: not ranked yet ({entry['battles']}/{rankings.MIN_BATTLES[collection]} battles)"
+    
+    win_pct = int(rankings.win_rate(entry) * 100)
+    if standing['rank'] is None:
+        # Index missing or being rebuilt
+        return f"{label}: rank unavailable ({entry['wins']}W-{entry['losses']}L, {win_pct}%)"
+    return f"{label}: #{standing['rank']:,} of {standing['total']:,} ({entry['wins']}W-{entry['losses']}L, {win_pct}%)"
+
+@instrument.traced('pokerank')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
+    def do_GET(self):
+        # pokerank works for everyone but only in jennetdaria channel
+        query = urllib.parse.urlparse(self.path).query
+        params = urllib.parse.parse_qs(query)
+        
+        channel = params.get('channel', [''])[0].lower()
+        if channel != core.ALLOWED_CHANNEL:
+            self.send_response(403)
+            self.send_header('Content-type', 'text/plain')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(b"Unauthorized: This channel is not permitted to use this command.")
+            return
+        
+        user = params.get('user', [''])[0].lower()
+        # !pokerank @someone looks up another trainer
+        target = params.get('target', [''])[0].lower().replace('@', '').strip() or user
+        
+        try:
+            # Apply queued battles first, the target's included, so a trainer sees their latest fight
+            rankings.catch_up(db, [target])
+            standings = rankings.trainer_ranks(db, target)
+            parts = [format_standing(collection, standings[collection]) for collection in rankings.MIN_BATTLES]
+            
+            if target == user:
+                response = f"@{user}, " + " | ".join(parts)
+            else:
+                response = f"@{user}, {target}'s ranks: " + " | ".join(parts)
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(response.encode())
+            
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-type', 'text/plain')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(f"Error loading rank!".encode())
@@ -1,85 +1,121 @@
 # poketrain.py
 from http.server import BaseHTTPRequestHandler
-import json
 import urllib.parse
-import random
-import hashlib
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-from datetime import datetime, timezone, timedelta
+from google.api_core.exceptions import FailedPrecondition
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
-    firebase_admin.initialize_app(cred)
+from game import core, httpcache, instrument, training
 
-db = firestore.client()
+# Firestore client, created on first use
+db = core.db
 
-def get_time_until_reset():
-    """Calculate time until 12am UTC"""
-    utc_now = datetime.now(timezone.utc)
-    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    time_until = tomorrow - utc_now
-    
-    hours = int(time_until.total_seconds() // 3600)
-    minutes = int((time_until.total_seconds() % 3600) // 60)
-    seconds = int(time_until.total_seconds() % 60)
-    
-    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+# Species data and evolution graph. Built off to the side and swapped in with
+# a single assignment, so a request never sees a half-built cache.
+CACHE = None
+REFERENCE_SECTIONS = ['pokemon_data']
+
+def build_cache(data):
+    """Build the training cache (evolution graph) from reference data"""
+    return {
+        'reference': data,
+        'evolutions': training.build_evolution_graph(data['pokemon_data'])
+    }
+
+# Shared reference cache layout (game/core.py); CACHE is its current tables
+REFERENCE_CACHE = core.new_reference_cache(REFERENCE_SECTIONS, build_cache)
+
+def load_training_data():
+    """Load the evolution graph into cache, re-checking game_config/versions on a TTL"""
+    global CACHE
+    CACHE = core.load_reference_cache(REFERENCE_CACHE)
+    return CACHE is not None
 
 def check_evolution(pokemon_name, old_level, new_level, level_gain):
     """Check if Pokemon can evolve and return evolution if applicable"""
-    # Evolution only happens with 9-10 level gains
-    if level_gain < 9:
-        return None
-        
-    try:
-        doc = db.collection('pokemon_data').document(pokemon_name).get()
-        if doc.exists:
-            poke_data = doc.to_dict()
-            # Check all evolution requirements
-            if (poke_data.get('can_evolve', False) and 
-                poke_data.get('can_train_evolve', False) and
-                poke_data.get('evolution_method') == 'level-up'):
-                
-                evolves_to = poke_data.get('evolves_to')
-                evo_level = poke_data.get('min_level_to_evolve')
-                
-                if evolves_to and evo_level and old_level < evo_level <= new_level:
-                    # Check if this is a branched evolution (pipe-separated)
-                    if '|' in str(evolves_to):
-                        # Split and randomly choose from the branches
-                        evolution_options = evolves_to.split('|')
-                        evolution = random.choice(evolution_options).strip()
-                    else:
-                        # Single evolution path
-                        evolution = evolves_to
-                    return evolution
-    except:
-        pass
-    return None
+    # Evolution only happens with 9-10 level gains; resolved from the cached graph
+    return training.resolve_evolution(CACHE['evolutions'], pokemon_name, old_level, new_level, level_gain)
 
 def get_weighted_level_gain():
     """Get level gain with weighted probabilities"""
-    levels = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-    weights = [1, 5, 8, 11, 14, 16, 14, 11, 8, 6, 6]  # Total: 100
-    return random.choices(levels, weights=weights, k=1)[0]
+    return training.get_weighted_level_gain()
+
+MAX_TRAINING_SESSIONS = 2
+MAX_TRAINING_ATTEMPTS = 5
+
+def train_team(pokemon_list, old_levels):
+    """Roll level gains and evolutions for a team
+    
+    Returns (pokemon, new levels, per-Pokemon result lines).
+    """
+    pokemon_list = list(pokemon_list)
+    new_levels = []
+    
+    # Build individual results for each Pokemon
+    training_results = []
+    for i, (pokemon, old_level) in enumerate(zip(pokemon_list, old_levels)):
+        level_gain = get_weighted_level_gain()
+        new_level = old_level + level_gain
+        new_levels.append(new_level)
+        
+        # Check for evolution
+        evolution = check_evolution(pokemon, old_level, new_level, level_gain)
+        if evolution:
+            training_results.append(f"{pokemon} gained +{level_gain} levels and evolved into {evolution}")
+            pokemon_list[i] = evolution
+        else:
+            training_results.append(f"{pokemon} gained +{level_gain} levels")
+    
+    return pokemon_list, new_levels, training_results
+
+@instrument.phase('train')
+def run_training(catch_ref):
+    """Train a caught team as one atomic read-compute-write
+    
+    The write carries a last_update_time precondition, so if another !poketrain
+    lands in between it fails and we retry from a fresh read - a session can't be
+    spent twice, and the normal case is one read plus one write.
+    Returns None if nothing is caught, else (training_used before, pokemon, levels,
+    result lines); result lines are None when no sessions are left.
+    """
+    for _ in range(MAX_TRAINING_ATTEMPTS):
+        snapshot = catch_ref.get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data or 'pokemon' not in data:
+            return None
+        
+        training_used = data.get('training_used', 0)
+        if training_used >= MAX_TRAINING_SESSIONS:
+            return training_used, data.get('pokemon', []), data.get('levels', []), None
+        
+        pokemon_list, new_levels, training_results = train_team(data.get('pokemon', []), data.get('levels', []))
+        try:
+            catch_ref.update({
+                'pokemon': pokemon_list,
+                'levels': new_levels,
+                'training_used': training_used + 1
+            }, option=db.write_option(last_update_time=snapshot.update_time))
+            return training_used, pokemon_list, new_levels, training_results
+        except FailedPrecondition:
+            # Someone else wrote the doc since our read - start over
+            continue
+    
+    raise RuntimeError("Too much contention training Pokemon")
 
-class handler(BaseHTTPRequestHandler):
+@instrument.traced('poketrain')
+class handler(httpcache.NoStoreMixin, BaseHTTPRequestHandler):
     def do_GET(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
 
         # SECURITY: Check channel authorization first
         channel = params.get('channel', [''])[0].lower()
-        if channel != 'jennetdaria':
+        if channel != core.ALLOWED_CHANNEL:
             self.send_response(403)
             self.send_header('Content-type', 'text/plain')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             self.wfile.write(b"Unauthorized: This channel is not permitted to use this command.")
             return
-
+        
         user = params.get('user', [''])[0].lower()
         uptime = params.get('uptime', [''])[0]
         user_level = params.get('user_level', ['regular'])[0].lower()
@@ -87,6 +123,16 @@ class handler(BaseHTTPRequestHandler):
         is_offline = uptime.lower() == 'offline'
         is_mod = user_level in ['moderator', 'owner']
         
+        # Load evolution data - not needed for the offline message regular
+        # viewers get
+        if (is_mod or not is_offline) and not load_training_data():
+            self.send_response(500)
+            self.send_header('Content-type', 'text/plain')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(b"Error: Could not load Pokemon data from database.")
+            return
+        
         try:
             if is_offline:
                 if not is_mod:
@@ -94,107 +140,38 @@ class handler(BaseHTTPRequestHandler):
                     response = f"@{user}, you cannot train pokemon while Jennet is offline. Please make sure to follow Jennet and come back when Jennet is live to catch, train, and battle pokemon!"
                 else:
                     # Mod offline training (daily)
-                    utc_now = datetime.now(timezone.utc)
-                    daily_id = f"mod_daily_{utc_now.strftime('%Y%m%d')}"
+                    daily_id = core.mod_daily_id()
                     catch_ref = db.collection('mod_daily').document(daily_id).collection('users').document(user)
-                    catch_doc = catch_ref.get()
+                    trained = run_training(catch_ref)
                     
-                    if not catch_doc.exists:
+                    if trained is None:
                         response = f"@{user}, you need to !pokecatch before training!"
                     else:
-                        data = catch_doc.to_dict()
+                        training_used, pokemon_list, levels, training_results = trained
                         
-                        if not data or 'pokemon' not in data:
-                            response = f"@{user}, you need to !pokecatch before training!"
+                        if training_results is None:
+                            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
+                            response = f"@{user}, you've already trained twice today! Your team: {', '.join(pokemon_with_levels)} | {core.get_time_until_reset()}"
                         else:
-                            training_used = data.get('training_used', 0)
-                            
-                            if training_used >= 2:
-                                pokemon_list = data.get('pokemon', [])
-                                levels = data.get('levels', [])
-                                pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
-                                response = f"@{user}, you've already trained twice today! Your team: {', '.join(pokemon_with_levels)} | {get_time_until_reset()}"
-                            else:
-                                # Train the Pokemon
-                                pokemon_list = data.get('pokemon', [])
-                                old_levels = data.get('levels', [])
-                                new_levels = []
-                                
-                                # Build individual results for each Pokemon
-                                training_results = []
-                                for i, (pokemon, old_level) in enumerate(zip(pokemon_list, old_levels)):
-                                    level_gain = get_weighted_level_gain()
-                                    new_level = old_level + level_gain
-                                    new_levels.append(new_level)
-                                    
-                                    # Check for evolution
-                                    evolution = check_evolution(pokemon, old_level, new_level, level_gain)
-                                    if evolution:
-                                        training_results.append(f"{pokemon} gained +{level_gain} levels and evolved into {evolution}")
-                                        pokemon_list[i] = evolution
-                                    else:
-                                        training_results.append(f"{pokemon} gained +{level_gain} levels")
-                                
-                                # Update database
-                                catch_ref.update({
-                                    'pokemon': pokemon_list,
-                                    'levels': new_levels,
-                                    'training_used': training_used + 1
-                                })
-                                
-                                trainings_left = 1 - training_used
-                                response = f"@{user} trained! {'! '.join(training_results)}! ({trainings_left} training session{'s' if trainings_left != 1 else ''} left) | {get_time_until_reset()}"
+                            trainings_left = 1 - training_used
+                            response = f"@{user} trained! {'! '.join(training_results)}! ({trainings_left} training session{'s' if trainings_left != 1 else ''} left) | {core.get_time_until_reset()}"
             else:
                 # Online training
-                stream_id = hashlib.md5(f"{channel}_{uptime}".encode()).hexdigest()
+                stream_id = core.stream_id(channel, uptime)
                 catch_ref = db.collection('catches').document(stream_id).collection('users').document(user)
-                catch_doc = catch_ref.get()
+                trained = run_training(catch_ref)
                 
-                if not catch_doc.exists:
+                if trained is None:
                     response = f"@{user}, you need to !pokecatch before training!"
                 else:
-                    data = catch_doc.to_dict()
+                    training_used, pokemon_list, levels, training_results = trained
                     
-                    if not data or 'pokemon' not in data:
-                        response = f"@{user}, you need to !pokecatch before training!"
+                    if training_results is None:
+                        pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
+                        response = f"@{user}, you've already trained twice this stream! Your team: {', '.join(pokemon_with_levels)}"
                     else:
-                        training_used = data.get('training_used', 0)
-                        
-                        if training_used >= 2:
-                            pokemon_list = data.get('pokemon', [])
-                            levels = data.get('levels', [])
-                            pokemon_with_levels = [f"{p} (Lv.{l})" for p, l in zip(pokemon_list, levels)]
-                            response = f"@{user}, you've already trained twice this stream! Your team: {', '.join(pokemon_with_levels)}"
-                        else:
-                            # Train the Pokemon
-                            pokemon_list = data.get('pokemon', [])
-                            old_levels = data.get('levels', [])
-                            new_levels = []
-                            
-                            # Build individual results for each Pokemon
-                            training_results = []
-                            for i, (pokemon, old_level) in enumerate(zip(pokemon_list, old_levels)):
-                                level_gain = get_weighted_level_gain()
-                                new_level = old_level + level_gain
-                                new_levels.append(new_level)
-                                
-                                # Check for evolution
-                                evolution = check_evolution(pokemon, old_level, new_level, level_gain)
-                                if evolution:
-                                    training_results.append(f"{pokemon} gained +{level_gain} levels and evolved into {evolution}")
-                                    pokemon_list[i] = evolution
-                                else:
-                                    training_results.append(f"{pokemon} gained +{level_gain} levels")
-                            
-                            # Update database
-                            catch_ref.update({
-                                'pokemon': pokemon_list,
-                                'levels': new_levels,
-                                'training_used': training_used + 1
-                            })
-                            
-                            trainings_left = 1 - training_used
-                            response = f"@{user} trained! {'! '.join(training_results)}! ({trainings_left} training session{'s' if trainings_left != 1 else ''} left)"
+                        trainings_left = 1 - training_used
+                        response = f"@{user} trained! {'! '.join(training_results)}! ({trainings_left} training session{'s' if trainings_left != 1 else ''} left)"
             
             self.send_response(200)
             self.send_header('Content-type', 'text/plain')
@@ -0,0 +1 @@
+# game package - code shared by the api/ endpoints and the offline tools
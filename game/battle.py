@@ -0,0 +1,99 @@
+# battle.py
+# Battle engine tables shared by pokebattle and the offline balance lab.
+# Nothing here touches Firestore - it only compiles reference data.
+
+# Battle balance constants
+LEVEL_POWER_RATE = 0.1  # power per level...
+LEVEL_POWER_CAP = 5  # ...capped at 5 points max
+LEGENDARY_POWER = 5  # legendary bonus (reduced from 10 to 5 for balance)
+STAGE_POWER = 2  # per evolution stage (2-6 points)
+TYPE_BONUS = 2.0  # per type advantage (increased to 2.0 from 1.5)
+RANDOM_POWER = 3  # random factor 0-3 (increased from 0-2)
+DEFAULT_TYPE = 'Normal'
+
+def build_species_tables(pokemon_data, legendaries):
+    """Intern species names to ids and precompute each species' base power
+    
+    The last id is reserved for species missing from pokemon_data, which battle
+    as a stage 1 Normal type like they always have.
+    """
+    legendary_set = set(legendaries)
+    names = list(pokemon_data) + [p for p in dict.fromkeys(legendaries) if p not in pokemon_data]
+    index = {name: i for i, name in enumerate(names)}
+    
+    base_power = []
+    type_strings = []
+    for name in names:
+        info = pokemon_data.get(name, {})
+        base_power.append(info.get('stage', 1) * STAGE_POWER + (LEGENDARY_POWER if name in legendary_set else 0))
+        type_strings.append(info.get('type', DEFAULT_TYPE))
+    
+    # Unknown species slot
+    base_power.append(1 * STAGE_POWER)
+    type_strings.append(DEFAULT_TYPE)
+    
+    return {
+        'names': names,
+        'index': index,
+        'unknown_id': len(names),
+        'base_power': base_power,
+        'type_strings': type_strings
+    }
+
+def build_type_tables(type_strings, type_advantages):
+    """Intern types and type combos to ints and precompute the combo matchup matrix
+    
+    matchup[a][b] is how many of combo a's types are strong against combo b's,
+    so a round's type bonus is two list lookups instead of string splits and scans.
+    species_combo is aligned with the species ids of type_strings.
+    """
+    type_index = {}
+    def intern_type(name):
+        if name not in type_index:
+            type_index[name] = len(type_index)
+        return type_index[name]
+    
+    intern_type(DEFAULT_TYPE)
+    for attacker, defenders in type_advantages.items():
+        intern_type(attacker)
+        for defender in defenders:
+            intern_type(defender)
+    
+    combo_index = {}
+    combos = []
+    def intern_combo(type_string):
+        combo = tuple(intern_type(t) for t in type_string.split('/'))
+        if combo not in combo_index:
+            combo_index[combo] = len(combos)
+            combos.append(combo)
+        return combo_index[combo]
+    
+    species_combo = [intern_combo(type_string) for type_string in type_strings]
+    
+    # Dense type chart: chart[attacker][defender] = 1 if super effective
+    n = len(type_index)
+    chart = [[0] * n for _ in range(n)]
+    for attacker, defenders in type_advantages.items():
+        for defender in defenders:
+            chart[type_index[attacker]][type_index[defender]] = 1
+    
+    matchup = [[sum(chart[t1][t2] for t1 in c1 for t2 in c2) for c2 in combos] for c1 in combos]
+    
+    return {
+        'type_index': type_index,
+        'type_chart': chart,
+        'combos': combos,
+        'matchup': matchup,
+        'species_combo': species_combo
+    }
+
+def build_battle_tables(data):
+    """Build the species and type tables from reference data"""
+    pokemon_data = data['pokemon_data']
+    type_advantages = data['game_config']['type_advantages'].get('data', {})
+    legendaries = data['game_config']['legendaries'].get('list', [])
+    species = build_species_tables(pokemon_data, legendaries)
+    return {
+        'species': species,
+        'types': build_type_tables(species['type_strings'], type_advantages)
+    }
@@ -0,0 +1,86 @@
+# bulk.py
+# Bulk collection deletes that fit inside one serverless invocation.
+#
+# Docs are fetched a page at a time (ids only), split into batches of at most
+# 500 writes and committed on a small thread pool, with a deletes-per-second
+# cap so a big clear doesn't starve live battles. Pages are sized to what the
+# cap allows in the budget left, and a run's first page is always deleted, so
+# even a short budget makes progress. Each run stops before its time budget;
+# since committed batches stay deleted, running it again simply picks up
+# what's left. A progress doc keeps the running total across runs.
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import firestore
+
+from game import instrument
+
+BATCH_LIMIT = 500  # Firestore's max writes per batch
+PAGE_SIZE = 2000
+MAX_WORKERS = 8
+MAX_DELETES_PER_SECOND = 5000
+TIME_BUDGET = 7.0  # seconds; leaves headroom under Vercel's 10s limit
+
+def progress_ref(db, job):
+    """Progress doc for a resumable bulk job"""
+    return db.collection('maintenance').document(job)
+
+def chunks(items, size):
+    """Split a list into consecutive slices of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def delete_refs(db, refs):
+    """Delete up to BATCH_LIMIT docs in one batch"""
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+    return len(refs)
+
+@instrument.phase('bulk_delete')
+def delete_collection(db, collection_ref, job, time_budget=TIME_BUDGET):
+    """Delete a collection's docs until it's empty or the time budget runs out
+
+    Returns (total deleted across runs of this job, done). When done the
+    progress doc is removed, so the next run of the job starts from zero.
+    """
+    started = time.monotonic()
+    deadline = started + time_budget
+    deleted = 0
+    done = False
+
+    def delete_chunk(chunk, first_page):
+        # Each batch checks the deadline itself, so a slow page can't overrun the budget
+        if time.monotonic() >= deadline and not first_page:
+            return 0
+        return delete_refs(db, chunk)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        first_page = True
+        while first_page or time.monotonic() < deadline:
+            # Deleted docs drop out of the query, so the first page is always what's left
+            limit = max(BATCH_LIMIT, min(PAGE_SIZE, int((deadline - time.monotonic()) * MAX_DELETES_PER_SECOND)))
+            refs = [doc.reference for doc in collection_ref.select([]).limit(limit).stream()]
+            if not refs:
+                done = True
+                break
+
+            batches = chunks(refs, BATCH_LIMIT)
+            deleted += sum(pool.map(instrument.bind(delete_chunk), batches, [first_page] * len(batches)))
+            first_page = False
+
+            # Rate limit: never run ahead of MAX_DELETES_PER_SECOND, nor sleep past the deadline
+            now = time.monotonic()
+            ahead = min(deleted / MAX_DELETES_PER_SECOND - (now - started), deadline - now)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    progress = progress_ref(db, job)
+    previous = progress.get()
+    total = deleted + (previous.to_dict().get('deleted', 0) if previous.exists else 0)
+    if done:
+        progress.delete()
+    else:
+        progress.set({'deleted': firestore.Increment(deleted), 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+
+    return total, done
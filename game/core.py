@@ -0,0 +1,118 @@
+# core.py
+# Runtime shared by every endpoint: the Firestore client, the reference data
+# caches and the helpers each handler used to carry its own copy of.
+#
+# The client is created on first use rather than at import, so requests that
+# never reach Firestore (a 403 from the channel check, a cached response) don't
+# pay for parsing FIREBASE_CREDS and setting up the gRPC channel.
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from game import instrument, refdata
+
+ALLOWED_CHANNEL = 'jennetdaria'
+
+CLIENT = None
+# Held while creating CLIENT, so concurrent first requests build one client
+CLIENT_LOCK = threading.Lock()
+
+# 'firestore' (default), or a local stand-in from game.storage: 'memory' or
+# 'sqlite:PATH', for running the game without credentials
+STORAGE = os.environ.get('GAME_STORAGE', 'firestore')
+
+# Seconds before a failed reference data refresh is retried
+REFRESH_BACKOFF = 5
+
+log = logging.getLogger(__name__)
+
+def get_db():
+    """The storage client, initializing firebase_admin on first call"""
+    global CLIENT
+    if CLIENT is not None:
+        return CLIENT
+    with CLIENT_LOCK:
+        # Another request may have finished creating it while this one waited
+        if CLIENT is not None:
+            return CLIENT
+        if STORAGE != 'firestore':
+            from game import storage
+            CLIENT = storage.open_client(STORAGE)
+            return CLIENT
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(json.loads(os.environ.get('FIREBASE_CREDS')))
+            firebase_admin.initialize_app(cred)
+        # Every RPC is counted and timed against the request that made it
+        CLIENT = instrument.wrap_firestore(firestore.client())
+    return CLIENT
+
+class LazyClient:
+    """Stands in for the Firestore client, creating the real one on first use"""
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+# Endpoints use this like the client itself: db.collection(...), db.batch(), ...
+db = LazyClient()
+
+def get_time_until_reset():
+    """Calculate time until 12am UTC"""
+    utc_now = datetime.now(timezone.utc)
+    tomorrow = utc_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    time_until = tomorrow - utc_now
+
+    hours = int(time_until.total_seconds() // 3600)
+    minutes = int((time_until.total_seconds() % 3600) // 60)
+    seconds = int(time_until.total_seconds() % 60)
+
+    return f"GAME RESETS IN {hours} HRS, {minutes} MINS, {seconds} SECS"
+
+def stream_id(channel, uptime):
+    """Document id for a live stream, from the channel and the stream's uptime"""
+    return hashlib.md5(f"{channel}_{uptime}".encode()).hexdigest()
+
+def mod_daily_id():
+    """Document id for today's (UTC) offline mod session"""
+    return f"mod_daily_{datetime.now(timezone.utc).strftime('%Y%m%d')}"
+
+def new_reference_cache(sections, build):
+    """Reference data cache for an endpoint; build(data) makes its lookup tables
+
+    build must return a dict that keeps the reference data under 'reference'.
+    """
+    return {'sections': sections, 'build': build, 'value': None, 'checked_at': 0.0}
+
+@instrument.phase('reference')
+def load_reference_cache(cache):
+    """Built tables for a reference cache, re-checking game_config/versions on a TTL
+
+    New tables are built off to the side and swapped in with a single assignment,
+    so a request never sees a half-built cache. Returns None if nothing could be
+    loaded; a failed refresh keeps serving the tables we already have and isn't
+    retried for REFRESH_BACKOFF seconds, so an outage doesn't stall every request.
+    """
+    value = cache['value']
+    if value is not None and not refdata.version_check_due(cache['checked_at']):
+        return value
+
+    try:
+        if value is None:
+            data = refdata.load_reference_data(db, cache['sections'])
+        else:
+            # Only sections whose version stamp changed are refetched
+            data = refdata.refresh_reference_data(db, value['reference'], cache['sections'])
+
+        if data is not None:
+            value = cache['build'](data)
+            cache['value'] = value
+        cache['checked_at'] = time.monotonic()
+    except Exception:
+        log.exception("Loading reference data failed")
+        cache['checked_at'] = time.monotonic() - refdata.VERSION_CHECK_TTL + REFRESH_BACKOFF
+    return value
@@ -0,0 +1,54 @@
+# httpcache.py
+# Cache-Control for the endpoints.
+#
+# !pokeleaders and !pokelegends answer the same body to everyone and read
+# only the channel and season parameters, so their chatbot commands are set
+# up with URLs carrying just those. Their responses carry Cache-Control with
+# s-maxage, so the Vercel edge answers repeat requests without running the
+# function, plus an ETag taken from the body so clients and the edge can
+# revalidate with If-None-Match and get a bodyless 304.
+#
+# Every other command's URL carries the caller's user name and the stream's
+# uptime, and many bodies address the caller or change state, so no two
+# requests could share an edge entry: those handlers use NoStoreMixin, and
+# repeat work is saved by the in-process caches (game.ttlcache and the
+# reference data caches) instead.
+import hashlib
+
+NO_STORE = 'no-store'
+
+def etag_for(body):
+    """Strong ETag for a response body"""
+    return '"' + hashlib.sha1(body.encode('utf-8')).hexdigest()[:20] + '"'
+
+def cache_control(max_age, stale=None):
+    """Edge-cacheable Cache-Control value; browsers always revalidate"""
+    stale = max_age * 6 if stale is None else stale
+    return f"public, max-age=0, s-maxage={max_age}, stale-while-revalidate={stale}"
+
+def send_cache_headers(handler, max_age, etag):
+    """Add Cache-Control and ETag to a response being built"""
+    handler.send_header('Cache-Control', cache_control(max_age))
+    handler.send_header('ETag', etag)
+
+def matches(handler, etag):
+    """Whether the request's If-None-Match already names this ETag"""
+    if_none_match = handler.headers.get('If-None-Match', '')
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or f"W/{etag}" in tags or '*' in tags
+
+def not_modified(handler, max_age, etag):
+    """Answer with a bodyless 304 if the client already has this body"""
+    if not matches(handler, etag):
+        return False
+    handler.send_response(304)
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    send_cache_headers(handler, max_age, etag)
+    handler.end_headers()
+    return True
+
+class NoStoreMixin:
+    """Handler mixin that marks every response Cache-Control: no-store"""
+    def end_headers(self):
+        self.send_header('Cache-Control', NO_STORE)
+        super().end_headers()
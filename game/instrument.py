@@ -0,0 +1,234 @@
+# instrument.py
+# Per-request instrumentation: backend reads, writes, round trips and wall time,
+# in total and per phase, reported as a Server-Timing header and one JSON log
+# line per request.
+#
+# A handler class is wrapped with @traced('name'), which starts a trace for each
+# GET, adds Server-Timing when headers go out and logs the trace when the
+# request ends. Code marks phases with `with phase('name'):` or @phase('name');
+# phases nest, and a phase's numbers include its nested phases. Backend calls
+# report themselves through record(): the Firestore client via wrap_firestore
+# (core.get_db installs it), the game.storage stand-ins directly. Outside a
+# request everything here is a no-op.
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# REQUEST_LOG=off silences the per-request log line (Server-Timing stays)
+LOG_REQUESTS = os.environ.get('REQUEST_LOG', 'on') != 'off'
+
+# Firestore RPCs; streamed ones are timed until the stream is used up
+RPCS = {'batch_get_documents', 'run_query', 'run_aggregation_query', 'commit', 'begin_transaction',
+        'rollback', 'list_documents', 'list_collection_ids', 'batch_write', 'partition_query'}
+STREAMING_RPCS = {'batch_get_documents', 'run_query', 'run_aggregation_query'}
+
+LOCAL = threading.local()
+
+# Requests this instance has started; the first one is the cold start
+REQUESTS_SERVED = 0
+
+def new_counters():
+    return {'ms': 0.0, 'reads': 0, 'writes': 0, 'round_trips': 0}
+
+def current():
+    """Trace of the request running on this thread, or None"""
+    return getattr(LOCAL, 'trace', None)
+
+def start(endpoint):
+    """Begin tracing a request on this thread"""
+    global REQUESTS_SERVED
+    REQUESTS_SERVED += 1
+    trace = {
+        'endpoint': endpoint,
+        'started': time.perf_counter(),
+        'cold': REQUESTS_SERVED == 1,
+        'status': None,
+        'error': None,
+        'db': new_counters(),
+        'phases': {},
+        'lock': threading.Lock()
+    }
+    LOCAL.trace = trace
+    LOCAL.phases = ()
+    return trace
+
+@contextmanager
+def phase(name):
+    """Time a block (or, as a decorator, a function) as a named phase"""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    outer = LOCAL.phases
+    LOCAL.phases = outer + (name,)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        LOCAL.phases = outer
+        with trace['lock']:
+            trace['phases'].setdefault(name, new_counters())['ms'] += elapsed
+
+def record(reads=0, writes=0, round_trips=1, seconds=0.0):
+    """Count one backend call against the current request and its open phases"""
+    trace = current()
+    if trace is None:
+        return
+    with trace['lock']:
+        targets = [trace['db']] + [trace['phases'].setdefault(name, new_counters()) for name in LOCAL.phases]
+        for counters in targets:
+            counters['reads'] += reads
+            counters['writes'] += writes
+            counters['round_trips'] += round_trips
+        trace['db']['ms'] += seconds * 1000
+
+def bind(fn):
+    """fn, run in the caller's trace and phases - for work handed to other threads"""
+    trace, phases = current(), getattr(LOCAL, 'phases', ())
+
+    @functools.wraps(fn)
+    def bound(*args, **kwargs):
+        saved = current(), getattr(LOCAL, 'phases', ())
+        LOCAL.trace, LOCAL.phases = trace, phases
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            LOCAL.trace, LOCAL.phases = saved
+    return bound
+
+def elapsed_ms(trace):
+    return (time.perf_counter() - trace['started']) * 1000
+
+def describe(counters):
+    return f"reads={counters['reads']} writes={counters['writes']} rtt={counters['round_trips']}"
+
+def server_timing(trace):
+    """Server-Timing header value: each phase, backend totals and the request so far"""
+    with trace['lock']:
+        metrics = [f'{name};dur={c["ms"]:.1f};desc="{describe(c)}"' for name, c in trace['phases'].items()]
+        metrics.append(f'db;dur={trace["db"]["ms"]:.1f};desc="{describe(trace["db"])}"')
+    metrics.append(f'total;dur={elapsed_ms(trace):.1f}')
+    return ', '.join(metrics)
+
+def finish(trace):
+    """End a request's trace and write its log line"""
+    LOCAL.trace = None
+    LOCAL.phases = ()
+    if not LOG_REQUESTS:
+        return
+    line = {
+        'request': trace['endpoint'],
+        'status': trace['status'],
+        'ms': round(elapsed_ms(trace), 2),
+        'cold': trace['cold'],
+        'reads': trace['db']['reads'],
+        'writes': trace['db']['writes'],
+        'round_trips': trace['db']['round_trips'],
+        'db_ms': round(trace['db']['ms'], 2),
+        'phases': {name: dict(c, ms=round(c['ms'], 2)) for name, c in trace['phases'].items()}
+    }
+    if trace['error']:
+        line['error'] = trace['error']
+    print(json.dumps(line, separators=(',', ':')), flush=True)
+
+def traced(endpoint):
+    """Class decorator for a handler: trace each GET, send Server-Timing, log it"""
+    def decorate(cls):
+        do_get, send_response, end_headers = cls.do_GET, cls.send_response, cls.end_headers
+
+        @functools.wraps(do_get)
+        def traced_do_get(self):
+            trace = start(endpoint)
+            try:
+                do_get(self)
+            except BaseException as e:
+                trace['error'] = type(e).__name__
+                raise
+            finally:
+                finish(trace)
+
+        @functools.wraps(send_response)
+        def traced_send_response(self, code, message=None):
+            trace = current()
+            if trace is not None:
+                trace['status'] = code
+            send_response(self, code, message)
+
+        @functools.wraps(end_headers)
+        def traced_end_headers(self):
+            trace = current()
+            if trace is not None:
+                self.send_header('Server-Timing', server_timing(trace))
+            end_headers(self)
+
+        cls.do_GET = traced_do_get
+        cls.send_response = traced_send_response
+        cls.end_headers = traced_end_headers
+        return cls
+    return decorate
+
+def stream_reads(name, response):
+    """Documents a streamed Firestore response bills as reads"""
+    if name == 'batch_get_documents':
+        return 1 if ('found' in response or 'missing' in response) else 0
+    if name == 'run_query':
+        return 1 if 'document' in response else 0
+    return 0
+
+class FirestoreAPI:
+    """Stands in for a Firestore client's GAPIC API, recording every RPC
+
+    Every document get, query, commit and transaction call the client makes goes
+    through this one object, so wrapping it covers the whole client API.
+    """
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        method = getattr(self._api, name)
+        if name not in RPCS:
+            return method
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                # Failed calls (aborted commits, failed preconditions) still cost a round trip
+                record(seconds=time.perf_counter() - started)
+                raise
+            if name in STREAMING_RPCS:
+                return self._stream(name, result, started)
+            writes = len(result.write_results) if name == 'commit' else 0
+            record(writes=writes, seconds=time.perf_counter() - started)
+            return result
+        return call
+
+    def _stream(self, name, responses, started):
+        reads = 0
+        try:
+            for response in responses:
+                reads += stream_reads(name, response)
+                yield response
+        finally:
+            # Firestore bills an empty query result as one read
+            record(reads=max(reads, 1 if name == 'run_query' else 0), seconds=time.perf_counter() - started)
+
+def wrap_firestore(client):
+    """Record a Firestore client's RPCs against the running request
+
+    Swaps in FirestoreAPI behind the client's private _firestore_api; if a
+    client version doesn't have it, the client is left uninstrumented.
+    """
+    try:
+        api = client._firestore_api
+        if not isinstance(api, FirestoreAPI):
+            client._firestore_api_internal = FirestoreAPI(api)
+    except AttributeError:
+        pass
+    return client
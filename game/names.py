@@ -0,0 +1,72 @@
+# names.py
+# In-memory species name index for pokedex lookups and "did you mean" suggestions.
+
+# Candidates (by shared trigrams) that get a full edit-distance check
+MAX_SUGGESTION_CANDIDATES = 20
+
+def normalize_name(name):
+    """Lowercase and strip everything but letters and digits"""
+    return ''.join(c.lower() for c in name if c.isalnum())
+
+def name_trigrams(normalized):
+    """Trigrams of a normalized name, padded so short names still get some"""
+    padded = f"^{normalized}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def build_name_index(pokemon_data):
+    """Map normalized names to species ids plus a trigram index over them"""
+    by_normalized = {}
+    for name, info in pokemon_data.items():
+        by_normalized.setdefault(normalize_name(name), name)
+        if info.get('normalized_name'):
+            by_normalized.setdefault(info['normalized_name'], name)
+
+    trigrams = {}
+    for key in by_normalized:
+        for trigram in name_trigrams(key):
+            trigrams.setdefault(trigram, []).append(key)
+
+    return {'by_normalized': by_normalized, 'trigrams': trigrams}
+
+def lookup_name(index, pokemon_data, query):
+    """Resolve a user-typed name to a species id, or None"""
+    # Exact match with title case, like the old document lookup
+    title = query.strip().title()
+    if title in pokemon_data:
+        return title
+    return index['by_normalized'].get(normalize_name(query))
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def suggest_name(index, query):
+    """Closest species id to a misspelled query, or None if nothing is close"""
+    normalized = normalize_name(query)
+    if not normalized:
+        return None
+
+    # Rank keys by shared trigrams, then edit-distance check the best few
+    shared = {}
+    for trigram in name_trigrams(normalized):
+        for key in index['trigrams'].get(trigram, []):
+            shared[key] = shared.get(key, 0) + 1
+    candidates = sorted(shared, key=shared.get, reverse=True)[:MAX_SUGGESTION_CANDIDATES]
+
+    max_distance = max(1, len(normalized) // 3)
+    best = None
+    best_distance = max_distance + 1
+    for key in candidates:
+        distance = edit_distance(normalized, key)
+        if distance < best_distance:
+            best, best_distance = key, distance
+
+    return index['by_normalized'][best] if best else None
@@ -0,0 +1,61 @@
+# pool.py
+# Sharded available-opponents pool for !pokebattle random.
+#
+# Each live stream (catches/{stream_id}) and mod day (mod_daily/{daily_id})
+# lists the trainers who still have battles left across POOL_SHARDS docs,
+# {parent}/pool/{n}. A trainer always lives in the shard picked by a stable
+# hash of their name, so the ArrayUnion of a first catch and the ArrayRemove
+# of a trainer running out of battles land on one of several docs instead of
+# queueing on a single hot one during a raid. Picking an opponent reads every
+# shard in one batched get, so the pick stays uniform across trainers.
+import zlib
+
+from firebase_admin import firestore
+
+POOL_SHARDS = 8
+
+def shard_of(name):
+    """Shard a trainer's pool entry lives in (stable across instances)"""
+    return zlib.crc32(name.encode('utf-8')) % POOL_SHARDS
+
+def shard_ref(parent_ref, shard):
+    """One pool shard doc of a stream/day"""
+    return parent_ref.collection('pool').document(str(shard))
+
+def shard_refs(parent_ref):
+    """Every pool shard doc of a stream/day"""
+    return [shard_ref(parent_ref, shard) for shard in range(POOL_SHARDS)]
+
+def members(snapshots):
+    """Trainer names listed in pool shard snapshots"""
+    names = []
+    for snapshot in snapshots:
+        if snapshot.exists:
+            names.extend(snapshot.to_dict().get('available', []))
+    return names
+
+def join(parent_ref, name):
+    """Add a trainer to the pool (one write to their shard)"""
+    shard_ref(parent_ref, shard_of(name)).set({'available': firestore.ArrayUnion([name])}, merge=True)
+
+def queue_leave(batch, parent_ref, names):
+    """Queue removal of trainers from the pool, one write per shard touched"""
+    by_shard = {}
+    for name in names:
+        by_shard.setdefault(shard_of(name), []).append(name)
+    for shard, shard_names in by_shard.items():
+        batch.set(shard_ref(parent_ref, shard), {'available': firestore.ArrayRemove(shard_names)}, merge=True)
+
+def shard_docs(names):
+    """Pool shard contents for a full list of trainers: {shard: {'available': [...]}}"""
+    docs = {shard: {'available': []} for shard in range(POOL_SHARDS)}
+    for name in names:
+        docs[shard_of(name)]['available'].append(name)
+    return docs
+
+def replace(db, parent_ref, names):
+    """Rewrite every shard of a stream/day's pool from a full list of trainers"""
+    batch = db.batch()
+    for shard, doc in shard_docs(names).items():
+        batch.set(shard_ref(parent_ref, shard), doc)
+    batch.commit()
@@ -0,0 +1,421 @@
+# rankings.py
+# Materialized top-trainer lists for !pokeleaders and !pokelegends.
+#
+# rankings/{collection} holds the best trainers of the leaderboard or legends
+# collection, pre-sorted by wins then win rate, so the commands read one
+# document instead of streaming the whole collection.
+#
+# Battles don't maintain the top lists or the rank indexes themselves: the
+# battle's own batch adds both trainers to rank_queue/{name}, and the commands
+# that show standings (pokeleaders, pokelegends, pokerank) or tools/rank_index.py
+# drain the queue, folding the queued trainers' totals into both in one read
+# and one commit. A battle stays a single commit.
+#
+# rank_index/{collection} answers "what's my rank" without a scan: a histogram
+# of qualifying trainers by total wins, plus one bucket per wins value counting
+# trainers by total battles. With equal wins a higher win rate means fewer
+# battles, so a trainer's rank is 1 + everyone with more wins + everyone in
+# their bucket with fewer battles. Both histograms are split over INDEX_SHARDS
+# shard docs (rank_index/{collection}/shards/{n} and .../shards/{n}/wins/{wins})
+# so battles spread their increments instead of queueing on one hot doc. The
+# rank_index/{collection} doc itself is a marker written once the index is
+# complete; the index is built by tools/rank_index.py and then kept current
+# by update_standings as the queue drains.
+import logging
+import random
+
+from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition
+
+from game import instrument, reads
+
+# Minimum battles to appear, per stats collection
+MIN_BATTLES = {'leaderboard': 5, 'legends': 10}
+
+# Entries kept in each rankings doc. The commands show 5 ranks from the first
+# 10; the rest is slack so trainers sliding down can't open gaps in the top 10.
+TOP_STORED = 25
+
+# Entries the commands read from a rankings doc
+TOP_SHOWN = 10
+
+MAX_UPDATE_ATTEMPTS = 5
+
+# Shard docs each rank index histogram is split over
+INDEX_SHARDS = 4
+
+# Queued trainers folded in per drain; each can cost up to 8 writes in the
+# drain's batch (Firestore caps a batch at 500)
+DRAIN_LIMIT = 50
+# Smaller drains on the request path, so a command pays a few trainers' worth
+CATCH_UP_LIMIT = 10
+
+# Writes per batch when rebuilding a rank index (Firestore caps a batch at 500)
+REBUILD_BATCH_SIZE = 400
+
+log = logging.getLogger(__name__)
+
+def rankings_ref(db, collection):
+    """Rankings doc for a stats collection"""
+    return db.collection('rankings').document(collection)
+
+def make_entry(name, data):
+    """Rankings entry from a leaderboard/legends doc"""
+    return {
+        'name': name,
+        'wins': data.get('total_wins', 0),
+        'losses': data.get('total_losses', 0),
+        'battles': data.get('total_battles', 0)
+    }
+
+def win_rate(entry):
+    """Wins per battle (0 with no battles)"""
+    return entry['wins'] / entry['battles'] if entry['battles'] > 0 else 0
+
+def sort_key(entry):
+    """Sort by total wins first, then by win rate as tiebreaker"""
+    return (entry['wins'], win_rate(entry))
+
+def top_entries(entries, collection, limit=TOP_STORED):
+    """Qualifying entries, best first, cut to limit"""
+    qualified = [e for e in entries if e['battles'] >= MIN_BATTLES[collection]]
+    qualified.sort(key=sort_key, reverse=True)
+    return qualified[:limit]
+
+def merge_entries(current, updated, collection, removed=()):
+    """Replace/insert updated trainers (and drop removed ones) in a stored top list and re-rank"""
+    dropped = {e['name'] for e in updated} | set(removed)
+    return top_entries([e for e in current if e['name'] not in dropped] + updated, collection)
+
+@instrument.phase('rebuild_rankings')
+def rebuild_rankings(db, collection):
+    """Recompute a rankings doc from a full scan of its stats collection"""
+    entries = [make_entry(doc.id, doc.to_dict()) for doc in db.collection(collection).stream()]
+    top = top_entries(entries, collection)
+    rankings_ref(db, collection).set({'entries': top})
+    return top
+
+def load_rankings(db, collection):
+    """Stored top entries, rebuilding the doc if it doesn't exist yet or is marked stale"""
+    doc = rankings_ref(db, collection).get()
+    if doc.exists and not doc.to_dict().get('stale'):
+        return doc.to_dict().get('entries', [])
+    return rebuild_rankings(db, collection)
+
+def mark_stale(db, collections):
+    """Flag rankings docs for a rebuild on their next read (rebuild_rankings clears it)"""
+    batch = db.batch()
+    for collection in collections:
+        batch.set(rankings_ref(db, collection), {'stale': True}, merge=True)
+    batch.commit()
+
+@instrument.phase('remove_from_rankings')
+def remove_from_rankings(db, collection, name):
+    """Drop a deleted trainer from a rankings doc
+
+    The next trainer moves up from the stored slack. The doc is only rebuilt
+    from a full scan if that leaves fewer entries than the commands show while
+    trainers outside the stored list may still qualify.
+    """
+    ref = rankings_ref(db, collection)
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        snapshot = ref.get()
+        if not snapshot.exists:
+            return
+        stored = snapshot.to_dict().get('entries', [])
+        entries = merge_entries(stored, [], collection, removed=[name])
+        if entries == stored:
+            return
+        if len(entries) < TOP_SHOWN and len(stored) >= TOP_STORED:
+            rebuild_rankings(db, collection)
+            return
+        try:
+            ref.update({'entries': entries}, option=db.write_option(last_update_time=snapshot.update_time))
+            return
+        except FailedPrecondition:
+            continue
+
+    log.warning("Gave up removing %s from %s rankings; marking for rebuild", name, collection)
+    mark_stale(db, [collection])
+
+def rank_index_ref(db, collection):
+    """Marker doc of a rank index; it only exists while the index is complete"""
+    return db.collection('rank_index').document(collection)
+
+def index_shard_ref(db, collection, shard):
+    """Wins histogram shard of a rank index"""
+    return rank_index_ref(db, collection).collection('shards').document(str(shard))
+
+def rank_bucket_ref(db, collection, shard, wins):
+    """Battles histogram shard for one wins value"""
+    return index_shard_ref(db, collection, shard).collection('wins').document(str(wins))
+
+def stats_key(data):
+    """(total wins, total battles) of a leaderboard/legends doc"""
+    return data.get('total_wins', 0), data.get('total_battles', 0)
+
+def indexed_key(data):
+    """(wins, battles) the rank index counts a leaderboard/legends doc under, or None"""
+    key = data.get('rank_key')
+    return tuple(key) if key is not None else None
+
+def queue_index_move(batch, db, collection, old, new):
+    """Queue histogram increments for a trainer moving from old to new (wins, battles)
+    
+    Either side may be None (new trainer / removed trainer); keys below the
+    collection's minimum battles aren't counted. The move lands on one random
+    shard - only the sums across shards mean anything - and deltas that cancel
+    out aren't written, so a loss touches a single bucket doc.
+    """
+    wins_deltas = {}
+    bucket_deltas = {}
+    for key, delta in ((old, -1), (new, 1)):
+        if key is None or key[1] < MIN_BATTLES[collection]:
+            continue
+        wins, battles = key
+        wins_deltas[str(wins)] = wins_deltas.get(str(wins), 0) + delta
+        bucket = bucket_deltas.setdefault(wins, {})
+        bucket[str(battles)] = bucket.get(str(battles), 0) + delta
+    
+    shard = random.randrange(INDEX_SHARDS)
+    index_fields = {}
+    total = sum(wins_deltas.values())
+    if total:
+        index_fields['total'] = firestore.Increment(total)
+    if any(wins_deltas.values()):
+        index_fields['wins'] = {wins: firestore.Increment(delta) for wins, delta in wins_deltas.items() if delta}
+    if index_fields:
+        batch.set(index_shard_ref(db, collection, shard), index_fields, merge=True)
+    for wins, deltas in bucket_deltas.items():
+        if any(deltas.values()):
+            batch.set(rank_bucket_ref(db, collection, shard, wins), {
+                'battles': {battles: firestore.Increment(delta) for battles, delta in deltas.items() if delta}
+            }, merge=True)
+
+def record_results(db, batch, results):
+    """Queue a battle's stats increments for leaderboard and legends
+    
+    results maps trainer name -> won. Blind server-side increments: nothing is
+    read, so concurrent battles never conflict. The trainers are queued for the
+    next drain to re-rank them.
+    """
+    for collection in MIN_BATTLES:
+        for name, won in results.items():
+            batch.set(db.collection(collection).document(name), {
+                'total_battles': firestore.Increment(1),
+                'total_wins': firestore.Increment(1 if won else 0),
+                'total_losses': firestore.Increment(0 if won else 1),
+                'last_battle': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+    queue_update(batch, db, results)
+
+def rank_queue_ref(db, name):
+    """Queue entry of a trainer whose totals changed since the last drain"""
+    return db.collection('rank_queue').document(name)
+
+def queue_update(batch, db, names):
+    """Queue trainers for the next drain (blind writes, one doc per trainer)"""
+    for name in names:
+        batch.set(rank_queue_ref(db, name), {'queued_at': firestore.SERVER_TIMESTAMP})
+
+@instrument.phase('update_standings')
+def update_standings(db, names):
+    """Fold trainers' current totals into the top lists and the rank indexes
+    
+    One batched read of the rankings docs, the index markers and the trainers'
+    stats, then one batch: rankings docs whose entries changed, guarded by
+    last_update_time, plus each trainer's move in the index from where it's
+    counted (rank_key) to their current totals, guarded by the stats doc's
+    last_update_time. Retried if anything moved in between. When retries run
+    out the rankings docs are marked stale for load_rankings to rebuild; index
+    moves left behind are picked up by the trainer's next update. Missing
+    rankings docs and indexes are skipped.
+    """
+    collections = list(MIN_BATTLES)
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        top_refs = [rankings_ref(db, c) for c in collections]
+        index_refs = [rank_index_ref(db, c) for c in collections]
+        stat_refs = [db.collection(c).document(name) for c in collections for name in names]
+        snapshots = reads.get_snapshots(db, top_refs + index_refs + stat_refs)
+        top_snapshots = snapshots[:len(collections)]
+        index_snapshots = snapshots[len(collections):2 * len(collections)]
+        stat_snapshots = snapshots[2 * len(collections):]
+        
+        batch = db.batch()
+        writes = 0
+        for i, collection in enumerate(collections):
+            stats = [
+                (name, snapshot)
+                for name, snapshot in zip(names, stat_snapshots[i * len(names):(i + 1) * len(names)])
+                if snapshot.exists
+            ]
+            
+            top_snapshot = top_snapshots[i]
+            if top_snapshot.exists:
+                stored = top_snapshot.to_dict().get('entries', [])
+                entries = merge_entries(stored, [make_entry(name, snapshot.to_dict()) for name, snapshot in stats], collection)
+                if entries != stored:
+                    batch.update(top_refs[i], {'entries': entries}, option=db.write_option(last_update_time=top_snapshot.update_time))
+                    writes += 1
+            
+            if index_snapshots[i].exists:
+                for _, snapshot in stats:
+                    data = snapshot.to_dict()
+                    old, new = indexed_key(data), stats_key(data)
+                    if old == new:
+                        continue
+                    batch.update(snapshot.reference, {'rank_key': list(new)}, option=db.write_option(last_update_time=snapshot.update_time))
+                    queue_index_move(batch, db, collection, old, new)
+                    writes += 1
+        
+        if not writes:
+            return
+        try:
+            batch.commit()
+            return
+        except FailedPrecondition:
+            # A battle or another drain got in between - start over
+            continue
+    
+    log.warning("Gave up updating standings of %s; marking top lists for rebuild", names)
+    mark_stale(db, collections)
+
+@instrument.phase('drain_rank_queue')
+def drain_rank_queue(db, limit=DRAIN_LIMIT, names=()):
+    """Apply the oldest queued trainers' totals to the top lists and indexes
+    
+    names are updated along with them, queued or not, so a command can bring
+    its own trainer up to date however long the queue is (their queue entry
+    goes with a later drain). Queue entries are removed only if no battle
+    re-queued them meanwhile; otherwise the next drain repeats the update,
+    which is idempotent. Returns how many queue entries were drained.
+    """
+    queued = list(db.collection('rank_queue').order_by('queued_at').limit(limit).stream())
+    if not queued:
+        return 0
+    queued_names = [doc.id for doc in queued]
+    update_standings(db, queued_names + [name for name in names if name not in queued_names])
+    
+    batch = db.batch()
+    for doc in queued:
+        batch.delete(doc.reference, option=db.write_option(last_update_time=doc.update_time))
+    try:
+        batch.commit()
+    except FailedPrecondition:
+        pass
+    return len(queued)
+
+def catch_up(db, names=()):
+    """Best-effort drain before showing standings; a failure is logged and the stored standings served"""
+    try:
+        drain_rank_queue(db, CATCH_UP_LIMIT, names)
+    except Exception:
+        log.exception("Draining the rank queue failed")
+
+def commit_in_batches(db, writes):
+    """Commit ('set' | 'update' | 'delete', ref, data) writes in order, REBUILD_BATCH_SIZE at a time"""
+    for start in range(0, len(writes), REBUILD_BATCH_SIZE):
+        batch = db.batch()
+        for op, ref, data in writes[start:start + REBUILD_BATCH_SIZE]:
+            if op == 'delete':
+                batch.delete(ref)
+            elif op == 'update':
+                batch.update(ref, data)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+
+@instrument.phase('rebuild_rank_index')
+def rebuild_rank_index(db, collection):
+    """Recompute a rank index from a full scan of its stats collection
+    
+    A full scan, so it's run from tools/rank_index.py (or after the collection
+    is emptied), never from a command. The marker doc is deleted first, which
+    makes syncs skip the collection and !pokerank answer "rank unavailable"
+    until the new index is complete; it's written back last.
+    """
+    deletes = [('delete', rank_index_ref(db, collection), None)]
+    for shard in range(INDEX_SHARDS):
+        deletes += [('delete', doc.reference, None) for doc in index_shard_ref(db, collection, shard).collection('wins').stream()]
+        deletes.append(('delete', index_shard_ref(db, collection, shard), None))
+    commit_in_batches(db, deletes)
+    
+    buckets = {}
+    writes = []
+    for doc in db.collection(collection).stream():
+        data = doc.to_dict()
+        key = stats_key(data)
+        wins, battles = key
+        if battles >= MIN_BATTLES[collection]:
+            bucket = buckets.setdefault(str(wins), {})
+            bucket[str(battles)] = bucket.get(str(battles), 0) + 1
+        if indexed_key(data) != key:
+            writes.append(('update', doc.reference, {'rank_key': list(key)}))
+    
+    # Everything is counted in shard 0; later increments spread over the rest
+    writes += [('set', rank_bucket_ref(db, collection, 0, wins), {'battles': bucket}) for wins, bucket in buckets.items()]
+    writes.append(('set', index_shard_ref(db, collection, 0), {
+        'wins': {wins: sum(bucket.values()) for wins, bucket in buckets.items()},
+        'total': sum(sum(bucket.values()) for bucket in buckets.values())
+    }))
+    # Marker last, so it only exists once every shard and rank_key is written
+    writes.append(('set', rank_index_ref(db, collection), {'shards': INDEX_SHARDS}))
+    commit_in_batches(db, writes)
+
+def sum_counts(docs, field):
+    """Add up one histogram field across shard docs: {key: count}"""
+    counts = {}
+    for doc in docs:
+        for key, count in (doc or {}).get(field, {}).items():
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
+def rank_in_index(wins_counts, battles_counts, wins, battles):
+    """1-based rank of (wins, battles) from the summed histograms; ties share a rank
+    
+    With no wins the win rate is 0 whatever the battles, so every winless
+    trainer ties.
+    """
+    ahead = sum(count for w, count in wins_counts.items() if int(w) > wins)
+    if wins > 0:
+        ahead += sum(count for b, count in battles_counts.items() if int(b) < battles)
+    return ahead + 1
+
+@instrument.phase('trainer_ranks')
+def trainer_ranks(db, name):
+    """A trainer's standing in leaderboard and legends
+    
+    Two batched round trips (markers + stats docs, then the index shards and
+    the trainer's bucket shards). Returns {collection: {'entry', 'rank', 'total'}};
+    rank and total are None while the trainer hasn't played the minimum
+    battles, or while the collection's index is missing or being rebuilt.
+    """
+    index_refs = [rank_index_ref(db, c) for c in MIN_BATTLES]
+    stat_refs = [db.collection(c).document(name) for c in MIN_BATTLES]
+    snapshots = reads.get_snapshots(db, index_refs + stat_refs)
+    markers = [snapshot.to_dict() if snapshot.exists else None for snapshot in snapshots[:len(index_refs)]]
+    stats = [snapshot.to_dict() or {} for snapshot in snapshots[len(index_refs):]]
+    
+    standings = {}
+    shard_refs = {}
+    for collection, marker, data in zip(MIN_BATTLES, markers, stats):
+        entry = make_entry(name, data)
+        standings[collection] = {'entry': entry, 'rank': None, 'total': None}
+        if marker is not None and entry['battles'] >= MIN_BATTLES[collection]:
+            shards = range(marker.get('shards', INDEX_SHARDS))
+            shard_refs[collection] = (
+                [index_shard_ref(db, collection, shard) for shard in shards],
+                [rank_bucket_ref(db, collection, shard, entry['wins']) for shard in shards]
+            )
+    
+    refs = [ref for index_refs, bucket_refs in shard_refs.values() for ref in index_refs + bucket_refs]
+    docs = dict(zip([ref.path for ref in refs], reads.get_documents(db, refs)))
+    for collection, (index_refs, bucket_refs) in shard_refs.items():
+        index_docs = [docs[ref.path] for ref in index_refs]
+        wins_counts = sum_counts(index_docs, 'wins')
+        battles_counts = sum_counts([docs[ref.path] for ref in bucket_refs], 'battles')
+        standing = standings[collection]
+        standing['rank'] = rank_in_index(wins_counts, battles_counts, standing['entry']['wins'], standing['entry']['battles'])
+        standing['total'] = sum((doc or {}).get('total', 0) for doc in index_docs)
+    
+    return standings
@@ -0,0 +1,17 @@
+# reads.py
+# Batched document reads - one round trip for several documents.
+
+def get_snapshots(db, refs):
+    """Fetch refs with a single get_all call, returning snapshots in refs order"""
+    unique = list({ref.path: ref for ref in refs}.values())
+    if not unique:
+        return []
+    by_path = {snapshot.reference.path: snapshot for snapshot in db.get_all(unique)}
+    return [by_path[ref.path] for ref in refs]
+
+def get_documents(db, refs):
+    """Fetch refs with a single get_all call
+    
+    Returns each ref's data dict (None if the document doesn't exist), in refs order.
+    """
+    return [snapshot.to_dict() if snapshot.exists else None for snapshot in get_snapshots(db, refs)]
@@ -0,0 +1,139 @@
+# refdata.py
+# Versioned snapshot of the reference data (pokemon_data + game_config docs).
+#
+# tools/refdata.py writes data/reference_snapshot.json (vercel.json runs it as
+# the build command and bundles the file with every function); endpoints load it
+# from disk on cold start and only ask Firestore for the small
+# game_config/versions doc to find out whether any section has moved on since
+# the snapshot was built. Warm instances re-check that doc every
+# VERSION_CHECK_TTL seconds and refetch just the sections whose stamp changed.
+# If the versions read fails on cold start, the snapshot is served as-is.
+import json
+import logging
+import os
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# REFDATA_SNAPSHOT points local runs (benchmarks, load tests) at another snapshot
+SNAPSHOT_PATH = os.environ.get('REFDATA_SNAPSHOT') or os.path.join(ROOT_DIR, 'data', 'reference_snapshot.json')
+SNAPSHOT_FORMAT = 1
+
+# Seconds a warm instance trusts its cache before re-reading game_config/versions
+VERSION_CHECK_TTL = 60
+
+# game_config docs that make up the reference data (each is its own section)
+CONFIG_SECTIONS = ['legendaries', 'type_advantages', 'spawn_weights']
+ALL_SECTIONS = ['pokemon_data'] + CONFIG_SECTIONS
+
+log = logging.getLogger(__name__)
+
+def empty_reference_data():
+    """Return an empty reference data dict in snapshot layout"""
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'versions': {},
+        'pokemon_data': {},
+        'game_config': {section: {} for section in CONFIG_SECTIONS}
+    }
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Load the bundled snapshot from disk, or None if missing/unreadable"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return snapshot
+
+def write_snapshot(data, path=SNAPSHOT_PATH):
+    """Write reference data to disk as compact JSON"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'), sort_keys=True, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+def fetch_versions(db):
+    """Read the per-section version stamps from game_config/versions"""
+    doc = db.collection('game_config').document('versions').get()
+    return doc.to_dict() if doc.exists else {}
+
+def fetch_sections(db, sections, data):
+    """Fetch the given sections from Firestore into a reference data dict"""
+    for section in sections:
+        if section == 'pokemon_data':
+            data['pokemon_data'] = {doc.id: doc.to_dict() for doc in db.collection('pokemon_data').stream()}
+        else:
+            doc = db.collection('game_config').document(section).get()
+            data['game_config'][section] = doc.to_dict() if doc.exists else {}
+    return data
+
+def build_snapshot(db, sections=ALL_SECTIONS):
+    """Fetch everything from Firestore in snapshot layout"""
+    # Read versions first so a concurrent edit can only make the snapshot look older
+    data = empty_reference_data()
+    versions = fetch_versions(db)
+    fetch_sections(db, sections, data)
+    data['versions'] = {section: versions.get(section, 0) for section in sections}
+    return data
+
+def section_stale(section, versions, held):
+    """True if the held copy of a section isn't the version Firestore has
+    
+    Any difference counts, not just a newer stamp, so a rolled-back version
+    is refetched too.
+    """
+    return section not in held or versions.get(section, 0) != held[section]
+
+def load_reference_data(db, sections):
+    """Load sections from the bundled snapshot, refetching any that Firestore has newer
+    
+    If game_config/versions can't be read, a snapshot holding every section is
+    returned unchecked (the next version check catches it up); without one the
+    error is raised.
+    """
+    snapshot = load_snapshot() or empty_reference_data()
+    snapshot_versions = snapshot.get('versions', {})
+    try:
+        versions = fetch_versions(db)
+    except Exception:
+        if not all(section in snapshot_versions for section in sections):
+            raise
+        log.exception("Reading game_config/versions failed; serving the bundled snapshot")
+        return snapshot
+    
+    stale = [s for s in sections if section_stale(s, versions, snapshot_versions)]
+    if stale:
+        fetch_sections(db, stale, snapshot)
+    
+    snapshot['versions'] = {section: versions.get(section, 0) for section in sections}
+    return snapshot
+
+def refresh_reference_data(db, data, sections):
+    """Return a copy of data with changed sections refetched, or None if all current
+    
+    The copy shares unchanged sections with data and never mutates it, so callers
+    can keep serving the old dict until they swap in the new one.
+    """
+    versions = fetch_versions(db)
+    current = data.get('versions', {})
+    stale = [s for s in sections if section_stale(s, versions, current)]
+    if not stale:
+        return None
+    
+    refreshed = {
+        'format': SNAPSHOT_FORMAT,
+        'versions': dict(current),
+        'pokemon_data': data['pokemon_data'],
+        'game_config': dict(data['game_config'])
+    }
+    fetch_sections(db, stale, refreshed)
+    for section in stale:
+        refreshed['versions'][section] = versions.get(section, 0)
+    return refreshed
+
+def version_check_due(checked_at, ttl=VERSION_CHECK_TTL):
+    """True once a cache checked at checked_at (monotonic seconds) should be re-checked"""
+    return time.monotonic() - checked_at >= ttl
@@ -0,0 +1,174 @@
+# seasons.py
+# Leaderboard season archives, written before !pokeleaderclear wipes a season.
+#
+# seasons/{season_id} is the season header (trainer count, part count, top
+# trainers, anyone !pokeleaderdelete removed). The full standings are stored
+# columnar in seasons/{season_id}/parts/{n} as parallel names/wins/losses
+# arrays, ARCHIVE_PART_SIZE trainers per doc to stay well under Firestore's
+# 1 MiB document limit (a part cut short by a run's time budget holds fewer).
+# rankings/last_season copies the header's champions so "last season's
+# champions" is a single read. Removals noted during a season wait in
+# maintenance/season_removals, outside seasons, so listing seasons only
+# returns seasons.
+#
+# Archiving is resumable: the season id and how far the archive got (cursor,
+# parts written, running champions) live in the caller's progress doc and are
+# saved in the same batch as each part, so a run that hits its time budget is
+# continued by the next one - under the same season id, rewriting nothing.
+# The budget is checked before each page read, and each page is sized to what
+# the remaining budget can read at the rate the previous page came in, so a
+# short budget still archives a page per run rather than a single trainer.
+import time
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from game import instrument, rankings
+
+PAGE_SIZE = 1000
+MIN_PAGE_SIZE = 100
+READ_SECONDS_PER_DOC = 0.0005  # first page's guess; later pages use the measured rate
+ARCHIVE_PART_SIZE = 5000
+CHAMPIONS = 10
+
+def season_ref(db, season_id):
+    """Header doc of an archived season"""
+    return db.collection('seasons').document(season_id)
+
+def removals_ref(db):
+    """Trainers removed from the current season by !pokeleaderdelete"""
+    return db.collection('maintenance').document('season_removals')
+
+def last_season_ref(db):
+    """Champions of the most recently archived season"""
+    return rankings.rankings_ref(db, 'last_season')
+
+def new_season_id():
+    """Season id from the current UTC time"""
+    return datetime.now(timezone.utc).strftime('season_%Y%m%d_%H%M%S')
+
+def read_page(collection_ref, limit, start_after=None):
+    """Up to limit docs of a collection in document id order, after the id start_after"""
+    query = collection_ref.order_by('__name__').limit(limit)
+    if start_after is not None:
+        query = query.start_after({'__name__': start_after})
+    return list(query.stream())
+
+def page_limit(remaining, seconds_per_doc):
+    """Docs to ask for so a page read fits in the remaining budget"""
+    return max(MIN_PAGE_SIZE, min(PAGE_SIZE, int(remaining / seconds_per_doc)))
+
+def empty_part():
+    """Columnar archive part"""
+    return {'names': [], 'wins': [], 'losses': []}
+
+def load_progress(progress_ref):
+    """A clear's progress doc, claiming a new season id for it on the first run"""
+    snapshot = progress_ref.get()
+    if not snapshot.exists:
+        try:
+            progress_ref.create({'season_id': new_season_id(), 'archive': {'cursor': None, 'parts': 0, 'trainers': 0, 'champions': []}})
+        except AlreadyExists:
+            # Another run of the same clear got there first
+            pass
+        snapshot = progress_ref.get()
+    return snapshot.to_dict()
+
+def save_part(db, progress_ref, season_id, state, part, entries):
+    """Write one archive part and the archive's new position in one batch; returns the new state"""
+    state = {
+        'cursor': part['names'][-1],
+        'parts': state['parts'] + 1,
+        'trainers': state['trainers'] + len(entries),
+        'champions': rankings.top_entries(state['champions'] + entries, 'leaderboard', CHAMPIONS)
+    }
+    batch = db.batch()
+    # Keyed by part number, so a part written by a run that died before saving its state is overwritten
+    batch.set(season_ref(db, season_id).collection('parts').document(str(state['parts'] - 1)), part)
+    batch.set(progress_ref, {'archive': state}, merge=True)
+    batch.commit()
+    return state
+
+def record_removal(batch, db, name, data):
+    """Queue a note of a trainer's stats before !pokeleaderdelete removes them"""
+    batch.set(removals_ref(db), {
+        'trainers': {name: {
+            'wins': data.get('total_wins', 0),
+            'losses': data.get('total_losses', 0),
+            'removed_at': firestore.SERVER_TIMESTAMP
+        }}
+    }, merge=True)
+
+@instrument.phase('archive_leaderboard')
+def archive_leaderboard(db, progress_ref, deadline):
+    """Archive the leaderboard collection as a season, before it gets cleared
+
+    Continues from the position saved in progress_ref (a bulk job's progress
+    doc, which keeps the season id across runs). Every run reads at least
+    one page; after that, once deadline (a time.monotonic() value) passes,
+    the part in hand is written short and the run stops. Returns (season id, trainers archived so far, done); the season id
+    is None if the leaderboard was empty.
+    """
+    progress = load_progress(progress_ref)
+    season_id = progress['season_id']
+    state = progress['archive']
+    if state.get('done'):
+        return (season_id if state['trainers'] else None), state['trainers'], True
+
+    part = empty_part()
+    entries = []
+    cursor = state['cursor']
+    seconds_per_doc = READ_SECONDS_PER_DOC
+    first_page = True
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 and not first_page:
+            if part['names']:
+                state = save_part(db, progress_ref, season_id, state, part, entries)
+            return season_id, state['trainers'], False
+        first_page = False
+
+        limit = page_limit(remaining, seconds_per_doc)
+        started = time.monotonic()
+        page = read_page(db.collection('leaderboard'), limit, cursor)
+        if page:
+            seconds_per_doc = (time.monotonic() - started) / len(page)
+            cursor = page[-1].id
+
+        for doc in page:
+            entry = rankings.make_entry(doc.id, doc.to_dict())
+            entries.append(entry)
+            part['names'].append(entry['name'])
+            part['wins'].append(entry['wins'])
+            part['losses'].append(entry['losses'])
+            if len(part['names']) >= ARCHIVE_PART_SIZE:
+                state = save_part(db, progress_ref, season_id, state, part, entries)
+                part = empty_part()
+                entries = []
+        if len(page) < limit:
+            break
+
+    if part['names']:
+        state = save_part(db, progress_ref, season_id, state, part, entries)
+    if not state['trainers']:
+        progress_ref.set({'archive': {'done': True}}, merge=True)
+        return None, 0, True
+
+    removals = removals_ref(db).get()
+    header = {
+        'archived_at': firestore.SERVER_TIMESTAMP,
+        'trainers': state['trainers'],
+        'parts': state['parts'],
+        'champions': state['champions'],
+        'removed': removals.to_dict().get('trainers', {}) if removals.exists else {}
+    }
+
+    # Header last, so a season only shows up once all its parts are written
+    batch = db.batch()
+    batch.set(season_ref(db, season_id), header)
+    batch.set(last_season_ref(db), {'season': season_id, 'archived_at': firestore.SERVER_TIMESTAMP, 'entries': state['champions']})
+    batch.delete(removals_ref(db))
+    batch.set(progress_ref, {'archive': {'done': True}}, merge=True)
+    batch.commit()
+    return season_id, state['trainers'], True
@@ -0,0 +1,98 @@
+# spawn.py
+# Spawn table used by pokecatch (and the offline balance lab) to roll teams.
+import random
+
+# Default tier split when game_config/spawn_weights has no 'tiers' entry
+DEFAULT_TIER_WEIGHTS = {'legendary': 3, 'regular': 97}  # 3% legendary chance
+LEGENDARY_LEVELS = (40, 50)
+
+def build_alias_table(weights):
+    """Build Vose alias tables so each weighted pick costs one roll and one compare"""
+    n = len(weights)
+    total = sum(weights)
+    if n == 0:
+        return [], []
+    if total <= 0:
+        # Nothing weighted - fall back to a uniform pick
+        weights = [1] * n
+        total = n
+    
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, w in enumerate(scaled) if w < 1.0]
+    large = [i for i, w in enumerate(scaled) if w >= 1.0]
+    
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    
+    # Whatever is left over is exactly 1.0 up to float error
+    return prob, alias
+
+def build_spawn_table(pokemon_data, legendaries, spawn_config):
+    """Compile the spawn pool into a flat alias table with per-entry level ranges"""
+    tier_weights = dict(DEFAULT_TIER_WEIGHTS)
+    tier_weights.update(spawn_config.get('tiers', {}))
+    species_weights = spawn_config.get('species', {})
+    
+    legendary_set = set(legendaries)
+    regular = [p for p in pokemon_data if p not in legendary_set]
+    if not regular:
+        regular = list(pokemon_data)
+    
+    tiers = [('regular', regular)]
+    if legendaries:
+        tiers.append(('legendary', list(legendaries)))
+    
+    names = []
+    levels = []
+    weights = []
+    for tier, members in tiers:
+        member_weights = [max(species_weights.get(p, 1), 0) for p in members]
+        member_total = sum(member_weights)
+        tier_weight = max(tier_weights.get(tier, 0), 0)
+        if not members or member_total <= 0 or tier_weight <= 0:
+            continue
+        
+        for pokemon, weight in zip(members, member_weights):
+            if tier == 'legendary':
+                level_range = LEGENDARY_LEVELS
+            else:
+                poke_info = pokemon_data.get(pokemon, {})
+                level_range = (poke_info.get('catch_level_min', 5), poke_info.get('catch_level_max', 45))
+            names.append(pokemon)
+            levels.append(level_range)
+            weights.append(tier_weight * weight / member_total)
+    
+    prob, alias = build_alias_table(weights)
+    return {'names': names, 'levels': levels, 'prob': prob, 'alias': alias}
+
+def roll_team(spawn_table, team_size):
+    """Roll team_size Pokemon and levels from a compiled spawn table"""
+    caught = []
+    levels = []
+    
+    names = spawn_table['names']
+    level_ranges = spawn_table['levels']
+    prob = spawn_table['prob']
+    alias = spawn_table['alias']
+    
+    for _ in range(team_size):
+        # Alias method: pick a column, then keep it or take its alias
+        i = random.randrange(len(prob))
+        if random.random() >= prob[i]:
+            i = alias[i]
+        
+        min_level, max_level = level_ranges[i]
+        caught.append(names[i])
+        levels.append(random.randint(min_level, max_level))
+    
+    return caught, levels
@@ -0,0 +1,28 @@
+# storage package - Firestore-compatible client over local document stores
+#
+# Lets the endpoints, benchmarks and load tests run without live credentials:
+#
+#   from game.storage import memory_client
+#   core.CLIENT = memory_client()
+#
+# or, for every endpoint in a process, GAME_STORAGE=memory / sqlite:game.db
+# (see core.get_db and open_client).
+from game.storage.client import Client
+from game.storage.memory import MemoryStore
+from game.storage.sqlite import SQLiteStore
+
+def memory_client():
+    """Client backed by a fresh in-memory store"""
+    return Client(MemoryStore())
+
+def sqlite_client(path):
+    """Client backed by a SQLite file, created if missing"""
+    return Client(SQLiteStore(path))
+
+def open_client(spec):
+    """Client for a storage spec: 'memory' or 'sqlite:PATH'"""
+    if spec == 'memory':
+        return memory_client()
+    if spec.startswith('sqlite:'):
+        return sqlite_client(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown storage {spec!r}; expected 'memory' or 'sqlite:PATH'")
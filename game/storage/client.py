@@ -0,0 +1,481 @@
+# client.py
+# Firestore-compatible client over a pluggable document store.
+#
+# Implements the slice of the google-cloud-firestore client API the game uses:
+# collection/document refs, get/set/update/create/delete, collection streams
+# and simple queries, get_all, batches, transactions (usable with
+# firestore.transactional) and last_update_time preconditions. Field transforms
+# (Increment, ArrayUnion, ArrayRemove, SERVER_TIMESTAMP, DELETE_FIELD) are
+# applied here too, so a store only has to get, put, delete and list documents.
+#
+# A store provides:
+#   atomic()          context manager; commits run inside it
+#   snapshot()        context manager; reads run inside it (a consistent view
+#                     that needn't block writers)
+#   get(path)         {'data', 'create_time', 'update_time'} or None
+#   put(path, record) / delete(path)
+#   list(collection)  doc ids directly under a collection path, sorted
+import copy
+import itertools
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+
+from game import instrument
+
+# Comparison operators supported by Query.where
+OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b)
+}
+
+MISSING = object()
+
+def get_field(data, field_path):
+    """Value at a dotted field path, or MISSING"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def transform(current, value, now):
+    """Resolve a written value (possibly a field transform) against the field's current value"""
+    if value is firestore.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, firestore.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, firestore.ArrayUnion):
+        array = list(current) if isinstance(current, list) else []
+        array.extend(v for v in value.values if v not in array)
+        return array
+    if isinstance(value, firestore.ArrayRemove):
+        return [v for v in current if v not in value.values] if isinstance(current, list) else []
+    if isinstance(value, dict):
+        return merge_fields({}, value, now)
+    return copy.deepcopy(value)
+
+def merge_fields(target, data, now):
+    """Deep-merge data into target (set with merge=True semantics)"""
+    for key, value in data.items():
+        if value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            current = target.get(key)
+            target[key] = merge_fields(dict(current) if isinstance(current, dict) else {}, value, now)
+        else:
+            target[key] = transform(target.get(key), value, now)
+    return target
+
+def update_fields(target, data, now):
+    """Apply update() field paths to target; nested maps are replaced, not merged"""
+    for field_path, value in data.items():
+        parts = field_path.split('.')
+        parent = target
+        for part in parts[:-1]:
+            if not isinstance(parent.get(part), dict):
+                parent[part] = {}
+            parent = parent[part]
+        if value is firestore.DELETE_FIELD:
+            parent.pop(parts[-1], None)
+        else:
+            parent[parts[-1]] = transform(parent.get(parts[-1]), value, now)
+    return target
+
+class DocumentSnapshot:
+    """Result of reading one document"""
+    def __init__(self, reference, record, read_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = record is not None
+        self._data = record['data'] if record else None
+        self.create_time = record['create_time'] if record else None
+        self.update_time = record['update_time'] if record else None
+        self.read_time = read_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field_path):
+        value = get_field(self._data or {}, field_path)
+        if value is MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+class WriteOption:
+    """Precondition returned by Client.write_option"""
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+class Query:
+    """Filtered, ordered and limited view of one collection"""
+    def __init__(self, collection, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'cursor': self._cursor,
+            'fields': self._fields
+        }
+        state.update(changes)
+        return Query(self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in OPERATORS:
+            raise ValueError(f"Unsupported operator {op_string!r}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction == 'DESCENDING'),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document):
+        return self._copy(cursor=document)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def _sort_key(self, snapshot):
+        keys = []
+        for field_path, _ in self._orders:
+            if field_path == '__name__':
+                keys.append(snapshot.id)
+            else:
+                value = get_field(snapshot._data, field_path)
+                keys.append(None if value is MISSING else value)
+        return keys
+
+    def stream(self, transaction=None):
+        client = self._collection._client
+        snapshots = client._list(self._collection, transaction)
+        for field_path, op_string, value in self._filters:
+            matches = OPERATORS[op_string]
+            snapshots = [
+                s for s in snapshots
+                if get_field(s._data, field_path) is not MISSING and matches(get_field(s._data, field_path), value)
+            ]
+
+        # Stable sorts, last order first, so the first order_by wins; ids break ties
+        snapshots.sort(key=lambda s: s.id)
+        for i in reversed(range(len(self._orders))):
+            descending = self._orders[i][1]
+            snapshots.sort(key=lambda s: self._sort_key(s)[i], reverse=descending)
+
+        if self._cursor is not None:
+            # A snapshot, or {'__name__': id or reference} like Firestore accepts
+            cursor = self._cursor['__name__'] if isinstance(self._cursor, dict) else self._cursor
+            cursor_id = cursor if isinstance(cursor, str) else cursor.id
+            ids = [s.id for s in snapshots]
+            snapshots = snapshots[ids.index(cursor_id) + 1:] if cursor_id in ids else [
+                s for s in snapshots if s.id > cursor_id
+            ]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        if self._fields is not None:
+            for snapshot in snapshots:
+                snapshot._data = {f: v for f, v in snapshot._data.items() if f in self._fields}
+
+        return iter(snapshots)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+class CollectionReference(Query):
+    """Reference to a collection (top level or nested under a document)"""
+    def __init__(self, client, path):
+        super().__init__(self)
+        self._client = client
+        self._path = path
+        self.id = path.split('/')[-1]
+
+    @property
+    def parent(self):
+        if '/' not in self._path:
+            return None
+        return DocumentReference(self._client, self._path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def list_documents(self, page_size=None):
+        return [self.document(doc_id) for doc_id in self._client._store.list(self._path)]
+
+class DocumentReference:
+    """Reference to one document"""
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.split('/')[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._read([self], transaction)[0]
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge, None)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self, field_updates, False, option)])[0]
+
+    def create(self, document_data):
+        return self._client._commit([('create', self, document_data, False, None)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self, None, False, option)])[0]
+
+class WriteBatch:
+    """Writes committed together, all or nothing"""
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, False, option))
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, False, None))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, False, option))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+class Transaction(WriteBatch):
+    """Optimistic transaction: reads are validated when the writes commit
+
+    Implements the hooks firestore.transactional drives (_begin, _commit,
+    _rollback, _clean_up), raising Aborted when a document read in the
+    transaction changed before commit, which makes the decorator retry.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._read_versions = {}
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._ids)
+
+    def _clean_up(self):
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        writes, reads = self._writes, self._read_versions
+        try:
+            return self._client._commit(writes, reads)
+        finally:
+            self._clean_up()
+
+    def commit(self):
+        return self._commit()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter(self._client._read([ref_or_query], self))
+        return ref_or_query.stream(transaction=self)
+
+class Client:
+    """Firestore-compatible client over a document store"""
+    def __init__(self, store):
+        self._store = store
+        self._last_time = datetime.now(timezone.utc)
+        # Backend operation counters: documents read/written and calls made
+        self.ops = Counter()
+        self._local = threading.local()
+
+    @contextmanager
+    def tracking(self):
+        """Counter of the operations this thread makes inside the block"""
+        ops = Counter()
+        previous = getattr(self._local, 'ops', None)
+        self._local.ops = ops
+        try:
+            yield ops
+        finally:
+            self._local.ops = previous
+            if previous is not None:
+                previous.update(ops)
+
+    def _count(self, op, n=1):
+        self.ops[op] += n
+        tracked = getattr(self._local, 'ops', None)
+        if tracked is not None:
+            tracked[op] += n
+
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        return DocumentReference(self, document_path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaction(self, max_attempts, read_only)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return WriteOption(last_update_time, exists)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        return iter(self._read(list(references), transaction))
+
+    def _now(self):
+        """Strictly increasing commit timestamps, so update_time works as a version"""
+        now = datetime.now(timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _read(self, references, transaction=None):
+        started = time.perf_counter()
+        with self._store.snapshot():
+            self._count('round_trips')
+            self._count('reads', len(references))
+            read_time = self._now()
+            snapshots = [DocumentSnapshot(ref, copy.deepcopy(self._store.get(ref.path)), read_time) for ref in references]
+        instrument.record(reads=len(references), seconds=time.perf_counter() - started)
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._read_versions.setdefault(snapshot.reference.path, snapshot.update_time)
+        return snapshots
+
+    def _list(self, collection, transaction=None):
+        started = time.perf_counter()
+        with self._store.snapshot():
+            self._count('round_trips')
+            read_time = self._now()
+            snapshots = []
+            for doc_id in self._store.list(collection._path):
+                ref = collection.document(doc_id)
+                record = self._store.get(ref.path)
+                if record is not None:
+                    snapshots.append(DocumentSnapshot(ref, copy.deepcopy(record), read_time))
+            # Firestore bills an empty query result as one read
+            self._count('reads', max(1, len(snapshots)))
+        instrument.record(reads=max(1, len(snapshots)), seconds=time.perf_counter() - started)
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._read_versions.setdefault(snapshot.reference.path, snapshot.update_time)
+        return snapshots
+
+    def _commit(self, writes, read_versions=None):
+        """Check every precondition, then apply every write - or none of them"""
+        started = time.perf_counter()
+        try:
+            results = self._apply(writes, read_versions)
+        except Exception:
+            # Rejected commits cost a round trip too
+            instrument.record(seconds=time.perf_counter() - started)
+            raise
+        instrument.record(writes=len(writes), seconds=time.perf_counter() - started)
+        return results
+
+    def _apply(self, writes, read_versions):
+        with self._store.atomic():
+            self._count('round_trips')
+            self._count('writes', len(writes))
+            for path, version in (read_versions or {}).items():
+                record = self._store.get(path)
+                if (record['update_time'] if record else None) != version:
+                    raise Aborted(f"Document {path} changed during the transaction")
+
+            now = self._now()
+            pending = {}
+
+            def current(path):
+                return pending[path] if path in pending else self._store.get(path)
+
+            for kind, ref, data, merge, option in writes:
+                record = current(ref.path)
+                if kind == 'create' and record is not None:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if kind == 'update' and record is None:
+                    raise NotFound(f"No document to update: {ref.path}")
+                if option is not None:
+                    if option.exists is not None and option.exists != (record is not None):
+                        raise FailedPrecondition(f"Document {ref.path} existence precondition failed")
+                    if option.last_update_time is not None and (record is None or record['update_time'] != option.last_update_time):
+                        raise FailedPrecondition(f"Document {ref.path} was updated since it was read")
+
+                if kind == 'delete':
+                    pending[ref.path] = None
+                    continue
+                if kind == 'update':
+                    data = update_fields(copy.deepcopy(record['data']), data, now)
+                elif merge and record is not None:
+                    data = merge_fields(copy.deepcopy(record['data']), data, now)
+                else:
+                    data = merge_fields({}, data, now)
+                pending[ref.path] = {
+                    'data': data,
+                    'create_time': record['create_time'] if record else now,
+                    'update_time': now
+                }
+
+            for path, record in pending.items():
+                if record is None:
+                    self._store.delete(path)
+                else:
+                    self._store.put(path, record)
+
+        return [{'update_time': now} for _ in writes]
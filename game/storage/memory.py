@@ -0,0 +1,30 @@
+# memory.py
+# In-memory document store for the storage client - fast, per process, gone on exit.
+import threading
+
+class MemoryStore:
+    """Documents in nested dicts: collection path -> doc id -> record"""
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def atomic(self):
+        return self._lock
+
+    def snapshot(self):
+        return self._lock
+
+    def get(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def put(self, path, record):
+        collection, doc_id = path.rsplit('/', 1)
+        self._collections.setdefault(collection, {})[doc_id] = record
+
+    def delete(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        self._collections.get(collection, {}).pop(doc_id, None)
+
+    def list(self, collection):
+        return sorted(self._collections.get(collection, {}))
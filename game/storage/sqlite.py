@@ -0,0 +1,109 @@
+# sqlite.py
+# SQLite document store for the storage client - persists between runs and can
+# be shared by several processes (load generators, a local server, the seeder).
+#
+# One row per document, keyed by (collection path, doc id); document data is
+# JSON with datetimes tagged so they round-trip.
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    create_time TEXT NOT NULL,
+    update_time TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+) WITHOUT ROWID
+"""
+
+# Seconds to wait on another process's write lock before failing
+BUSY_TIMEOUT = 30
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in a document")
+
+def decode_object(obj):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+class SQLiteStore:
+    """Documents in a single SQLite table"""
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    def atomic(self):
+        # IMMEDIATE takes the write lock up front so commits from other
+        # processes serialize too
+        return self._transaction('BEGIN IMMEDIATE')
+
+    def snapshot(self):
+        # Deferred: a consistent read that never takes the write lock, so
+        # reads don't queue behind (or block) other processes' commits
+        return self._transaction('BEGIN')
+
+    @contextmanager
+    def _transaction(self, begin):
+        # The outermost block is one SQLite transaction
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self._conn.execute(begin)
+            try:
+                yield
+            except BaseException:
+                if self._depth == 1:
+                    self._conn.execute('ROLLBACK')
+                raise
+            else:
+                if self._depth == 1:
+                    self._conn.execute('COMMIT')
+            finally:
+                self._depth -= 1
+
+    def get(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        row = self._conn.execute(
+            'SELECT data, create_time, update_time FROM documents WHERE collection = ? AND doc_id = ?',
+            (collection, doc_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'data': json.loads(row[0], object_hook=decode_object),
+            'create_time': datetime.fromisoformat(row[1]),
+            'update_time': datetime.fromisoformat(row[2])
+        }
+
+    def put(self, path, record):
+        collection, doc_id = path.rsplit('/', 1)
+        self._conn.execute(
+            'INSERT OR REPLACE INTO documents (collection, doc_id, data, create_time, update_time) VALUES (?, ?, ?, ?, ?)',
+            (collection, doc_id, json.dumps(record['data'], default=encode_value),
+             record['create_time'].isoformat(), record['update_time'].isoformat())
+        )
+
+    def delete(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        self._conn.execute('DELETE FROM documents WHERE collection = ? AND doc_id = ?', (collection, doc_id))
+
+    def list(self, collection):
+        # BINARY collation orders UTF-8 like Python orders str, matching MemoryStore
+        rows = self._conn.execute('SELECT doc_id FROM documents WHERE collection = ? ORDER BY doc_id', (collection,))
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,76 @@
+# training.py
+# Training rules shared by poketrain and the offline balance lab.
+import random
+
+# Level gain per Pokemon per training session
+LEVEL_GAINS = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+LEVEL_GAIN_WEIGHTS = [1, 5, 8, 11, 14, 16, 14, 11, 8, 6, 6]  # Total: 100
+
+# Evolution only happens with 9-10 level gains
+EVOLUTION_MIN_GAIN = 9
+
+def get_weighted_level_gain():
+    """Get level gain with weighted probabilities"""
+    return random.choices(LEVEL_GAINS, weights=LEVEL_GAIN_WEIGHTS, k=1)[0]
+
+# Cap on evolutions followed in one session (guards against cycles in bad data)
+MAX_EVOLUTION_STEPS = 3
+
+def evolution_branches(poke_data):
+    """Split evolves_to into its branches (pipe-separated for branched evolutions)"""
+    return [branch.strip() for branch in str(poke_data.get('evolves_to') or '').split('|') if branch.strip()]
+
+def build_evolution_graph(pokemon_data):
+    """Compile pokemon_data into a directed evolution graph
+    
+    Each species maps to its outgoing edges: target, level threshold, method,
+    branch weight (optional 'evolution_weights' {target: weight} field, default 1)
+    and whether training may trigger it.
+    """
+    graph = {}
+    for name, info in pokemon_data.items():
+        if not info.get('can_evolve', False):
+            continue
+        weights = info.get('evolution_weights') or {}
+        edges = [
+            {
+                'to': branch,
+                'level': info.get('min_level_to_evolve'),
+                'method': info.get('evolution_method'),
+                'weight': weights.get(branch, 1),
+                'can_train_evolve': bool(info.get('can_train_evolve', False))
+            }
+            for branch in evolution_branches(info)
+        ]
+        if edges:
+            graph[name] = edges
+    return graph
+
+def training_edges(graph, pokemon_name):
+    """Edges of a species that a training level-up can trigger, at any level"""
+    return [
+        edge for edge in graph.get(pokemon_name, [])
+        if edge['can_train_evolve'] and edge['method'] == 'level-up' and edge['level'] and edge['weight'] > 0
+    ]
+
+def resolve_evolution(graph, pokemon_name, old_level, new_level, level_gain):
+    """Return the species a Pokemon ends up as after training, or None
+    
+    Follows every evolution whose threshold the session crossed, so a big level
+    gain can go through more than one stage. Branches are picked by weight.
+    """
+    if level_gain < EVOLUTION_MIN_GAIN:
+        return None
+    
+    current = pokemon_name
+    seen = {current}
+    for _ in range(MAX_EVOLUTION_STEPS):
+        edges = [edge for edge in training_edges(graph, current) if old_level < edge['level'] <= new_level]
+        if not edges:
+            break
+        current = random.choices(edges, weights=[edge['weight'] for edge in edges], k=1)[0]['to']
+        if current in seen:
+            break
+        seen.add(current)
+    
+    return current if current != pokemon_name else None
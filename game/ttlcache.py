@@ -0,0 +1,81 @@
+# ttlcache.py
+# Per-instance response cache with a short TTL and single-flight loading.
+#
+# When a command is spammed, the first request for a key does the work and
+# every concurrent request for the same key waits for its result instead of
+# hitting Firestore too. Results are then served from memory until the TTL runs
+# out or the key is invalidated. Failures are handed to the waiters but never
+# cached, so the next request tries again.
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 1000
+
+def new_cache(ttl, max_entries=DEFAULT_MAX_ENTRIES):
+    """Empty cache whose entries live for ttl seconds"""
+    return {
+        'ttl': ttl,
+        'max_entries': max_entries,
+        'entries': {},
+        'inflight': {},
+        'generation': 0,
+        'lock': threading.Lock()
+    }
+
+def make_room(cache, now):
+    """Drop expired entries, then the oldest ones, until a new entry fits (lock held)"""
+    entries = cache['entries']
+    if len(entries) < cache['max_entries']:
+        return
+    for key in [k for k, entry in entries.items() if entry['expires'] <= now]:
+        del entries[key]
+    # Insertion order is expiry order, since every entry gets the same TTL
+    while len(entries) >= cache['max_entries']:
+        del entries[next(iter(entries))]
+
+def get_or_compute(cache, key, compute):
+    """Cached value for key, calling compute() once per miss across concurrent callers"""
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is not None and time.monotonic() < entry['expires']:
+            return entry['value']
+
+        flight = cache['inflight'].get(key)
+        leader = flight is None
+        if leader:
+            generation = cache['generation']
+            flight = {'done': threading.Event(), 'value': None, 'error': None}
+            cache['inflight'][key] = flight
+
+    if not leader:
+        flight['done'].wait()
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['value']
+
+    try:
+        flight['value'] = compute()
+        with cache['lock']:
+            # Don't store a result that was computed across an invalidation
+            if cache['generation'] == generation:
+                now = time.monotonic()
+                cache['entries'].pop(key, None)
+                make_room(cache, now)
+                cache['entries'][key] = {'value': flight['value'], 'expires': now + cache['ttl']}
+        return flight['value']
+    except Exception as e:
+        flight['error'] = e
+        raise
+    finally:
+        with cache['lock']:
+            cache['inflight'].pop(key, None)
+        flight['done'].set()
+
+def invalidate(cache, key=None):
+    """Drop one key, or every key when key is None"""
+    with cache['lock']:
+        cache['generation'] += 1
+        if key is None:
+            cache['entries'].clear()
+        else:
+            cache['entries'].pop(key, None)
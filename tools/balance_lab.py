@@ -0,0 +1,280 @@
+# balance_lab.py
+# Monte Carlo balance lab for the 5v5 battle engine.
+#
+#   python tools/balance_lab.py --battles 1000000 --train 2
+#   python tools/balance_lab.py --type-bonus 1.5 --random-power 2 --json lab.json
+#
+# Teams are rolled from the same spawn table as !pokecatch, optionally put
+# through !poketrain sessions, then battled with the pokebattle formula in
+# batched NumPy form. Runs offline against data/reference_snapshot.json
+# (build it with tools/refdata.py snapshot). Needs numpy (tools/requirements.txt).
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import battle, refdata, spawn, training
+
+TEAM_SIZE = 5
+WINS_NEEDED = 3
+LEVEL_BAND = 10
+
+def default_params():
+    """Battle constants as currently shipped in game/battle.py"""
+    return {
+        'level_rate': battle.LEVEL_POWER_RATE,
+        'level_cap': battle.LEVEL_POWER_CAP,
+        'legendary_power': battle.LEGENDARY_POWER,
+        'stage_power': battle.STAGE_POWER,
+        'type_bonus': battle.TYPE_BONUS,
+        'random_power': battle.RANDOM_POWER
+    }
+
+def build_lab_tables(data):
+    """Compile reference data into the arrays the simulator indexes by species id"""
+    pokemon_data = data['pokemon_data']
+    legendaries = data['game_config']['legendaries'].get('list', [])
+    tables = battle.build_battle_tables(data)
+    species = tables['species']
+    types = tables['types']
+    index = species['index']
+    unknown_id = species['unknown_id']
+    n = unknown_id + 1
+
+    names = species['names'] + ['(unknown)']
+    stage = np.array([pokemon_data.get(name, {}).get('stage', 1) for name in species['names']] + [1])
+    legendary = np.zeros(n, dtype=bool)
+    for name in legendaries:
+        legendary[index[name]] = True
+
+    # Type membership per species (dual types count for both)
+    type_names = sorted(types['type_index'], key=types['type_index'].get)
+    membership = np.zeros((n, len(type_names)), dtype=bool)
+    for sid, combo in enumerate(types['species_combo']):
+        membership[sid, list(types['combos'][combo])] = True
+
+    # Training evolutions from the evolution graph, padded to the widest branch count.
+    # Branches of one species share min_level_to_evolve, so one threshold per species.
+    graph = training.build_evolution_graph(pokemon_data)
+    edges = [training.training_edges(graph, name) for name in species['names']] + [[]]
+    width = max([len(e) for e in edges] + [1])
+    evo_targets = np.tile(np.arange(n)[:, None], (1, width))
+    evo_cumulative = np.ones((n, width))
+    evo_level = np.zeros(n, dtype=np.int64)
+    for sid, species_edges in enumerate(edges):
+        if species_edges:
+            weights = np.array([edge['weight'] for edge in species_edges], dtype=float)
+            evo_targets[sid, :len(species_edges)] = [index.get(edge['to'], unknown_id) for edge in species_edges]
+            evo_cumulative[sid, :len(species_edges)] = np.cumsum(weights) / weights.sum()
+            evo_level[sid] = species_edges[0]['level']
+
+    spawn_table = spawn.build_spawn_table(pokemon_data, legendaries, data['game_config']['spawn_weights'])
+
+    return {
+        'names': names,
+        'stage': stage,
+        'legendary': legendary,
+        'type_names': type_names,
+        'membership': membership,
+        'species_combo': np.array(types['species_combo']),
+        'matchup': np.array(types['matchup']),
+        'evo_targets': evo_targets,
+        'evo_cumulative': evo_cumulative,
+        'evo_level': evo_level,
+        'spawn_sid': np.array([index.get(p, unknown_id) for p in spawn_table['names']], dtype=np.int64),
+        'spawn_min': np.array([lo for lo, hi in spawn_table['levels']], dtype=np.int64),
+        'spawn_max': np.array([hi for lo, hi in spawn_table['levels']], dtype=np.int64),
+        'spawn_prob': np.array(spawn_table['prob']),
+        'spawn_alias': np.array(spawn_table['alias'], dtype=np.int64)
+    }
+
+def roll_teams(rng, lab, size):
+    """Vectorized catch_pokemon: alias-sample size teams of TEAM_SIZE"""
+    column = rng.integers(0, len(lab['spawn_prob']), size=(size, TEAM_SIZE))
+    keep = rng.random(column.shape) < lab['spawn_prob'][column]
+    entry = np.where(keep, column, lab['spawn_alias'][column])
+    levels = rng.integers(lab['spawn_min'][entry], lab['spawn_max'][entry] + 1)
+    return lab['spawn_sid'][entry], levels
+
+def train_teams(rng, lab, sid, levels):
+    """Vectorized training session: weighted level gains plus training evolutions"""
+    weights = np.array(training.LEVEL_GAIN_WEIGHTS, dtype=float)
+    gains = rng.choice(training.LEVEL_GAINS, size=sid.shape, p=weights / weights.sum())
+    new_levels = levels + gains
+    can_evolve = gains >= training.EVOLUTION_MIN_GAIN
+
+    # Follow every threshold the session crossed (multi-stage evolutions)
+    for _ in range(training.MAX_EVOLUTION_STEPS):
+        threshold = lab['evo_level'][sid]
+        evolves = can_evolve & (threshold > 0) & (levels < threshold) & (threshold <= new_levels)
+        if not evolves.any():
+            break
+        roll = rng.random(sid.shape)[..., None]
+        branch = np.minimum((roll >= lab['evo_cumulative'][sid]).sum(axis=-1), lab['evo_targets'].shape[1] - 1)
+        sid = np.where(evolves, np.take_along_axis(lab['evo_targets'][sid], branch[..., None], -1)[..., 0], sid)
+    return sid, new_levels
+
+def battle_teams(rng, lab, params, sid_a, lvl_a, sid_b, lvl_b):
+    """Vectorized full_team_battle; returns (rounds won by A, rounds played, sorted teams)"""
+    base_power = lab['stage'] * params['stage_power'] + lab['legendary'] * params['legendary_power']
+
+    # Sort each team weakest to strongest (stable, like list.sort)
+    teams = []
+    for sid, lvl in ((sid_a, lvl_a), (sid_b, lvl_b)):
+        power = np.minimum(lvl * params['level_rate'], params['level_cap']) + base_power[sid]
+        order = np.argsort(power, axis=1, kind='stable')
+        teams.append((np.take_along_axis(sid, order, 1), np.take_along_axis(power, order, 1)))
+    (sid_a, power_a), (sid_b, power_b) = teams
+
+    combo_a = lab['species_combo'][sid_a]
+    combo_b = lab['species_combo'][sid_b]
+    power_a = power_a + lab['matchup'][combo_a, combo_b] * params['type_bonus'] + rng.random(sid_a.shape) * params['random_power']
+    power_b = power_b + lab['matchup'][combo_b, combo_a] * params['type_bonus'] + rng.random(sid_b.shape) * params['random_power']
+    round_a = power_a > power_b
+
+    # Rounds after someone reaches 3 wins are never played
+    wins_a_before = np.cumsum(round_a, axis=1) - round_a
+    wins_b_before = np.cumsum(~round_a, axis=1) - ~round_a
+    played = (wins_a_before < WINS_NEEDED) & (wins_b_before < WINS_NEEDED)
+    return round_a, played, sid_a, sid_b
+
+def new_stats(lab, max_band):
+    """Empty accumulators for simulate"""
+    n = len(lab['names'])
+    return {
+        'battles': 0,
+        'a_wins': 0,
+        'legendary_teams': np.zeros(TEAM_SIZE + 1),
+        'legendary_wins': np.zeros(TEAM_SIZE + 1),
+        'band_teams': np.zeros(max_band + 1),
+        'band_wins': np.zeros(max_band + 1),
+        'species_rounds': np.zeros(n),
+        'species_wins': np.zeros(n)
+    }
+
+def accumulate(stats, lab, sid_a, lvl_a, sid_b, lvl_b, round_a, played, sorted_a, sorted_b):
+    """Fold one batch of battles into the accumulators"""
+    n = len(lab['names'])
+    a_won = round_a.sum(axis=1) >= WINS_NEEDED
+    stats['battles'] += len(a_won)
+    stats['a_wins'] += int(a_won.sum())
+
+    # Team-level rows count both sides of every battle
+    max_band = len(stats['band_teams']) - 1
+    for sid, lvl, won in ((sid_a, lvl_a, a_won), (sid_b, lvl_b, ~a_won)):
+        legendary_count = lab['legendary'][sid].sum(axis=1)
+        stats['legendary_teams'] += np.bincount(legendary_count, minlength=TEAM_SIZE + 1)
+        stats['legendary_wins'] += np.bincount(legendary_count, weights=won, minlength=TEAM_SIZE + 1)
+        band = np.minimum(lvl.mean(axis=1) // LEVEL_BAND, max_band).astype(np.int64)
+        stats['band_teams'] += np.bincount(band, minlength=max_band + 1)
+        stats['band_wins'] += np.bincount(band, weights=won, minlength=max_band + 1)
+
+    # Round-level rows: each played round is one appearance per side
+    stats['species_rounds'] += np.bincount(sorted_a[played], minlength=n) + np.bincount(sorted_b[played], minlength=n)
+    stats['species_wins'] += np.bincount(sorted_a[played & round_a], minlength=n) + np.bincount(sorted_b[played & ~round_a], minlength=n)
+
+def simulate(lab, params, battles, batch_size=200000, train_sessions=0, seed=None):
+    """Run random-vs-random team battles in batches and return the accumulators"""
+    rng = np.random.default_rng(seed)
+    max_band = (int(lab['spawn_max'].max()) + train_sessions * training.LEVEL_GAINS[-1]) // LEVEL_BAND
+    stats = new_stats(lab, max_band)
+
+    remaining = battles
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        remaining -= size
+
+        sid_a, lvl_a = roll_teams(rng, lab, size)
+        sid_b, lvl_b = roll_teams(rng, lab, size)
+        for _ in range(train_sessions):
+            sid_a, lvl_a = train_teams(rng, lab, sid_a, lvl_a)
+            sid_b, lvl_b = train_teams(rng, lab, sid_b, lvl_b)
+
+        round_a, played, sorted_a, sorted_b = battle_teams(rng, lab, params, sid_a, lvl_a, sid_b, lvl_b)
+        accumulate(stats, lab, sid_a, lvl_a, sid_b, lvl_b, round_a, played, sorted_a, sorted_b)
+    return stats
+
+def rate_rows(labels, counts, wins, min_count=1):
+    """Pair up labels with sample counts and win rates, skipping empty rows"""
+    return [
+        {'label': label, 'samples': int(count), 'win_rate': float(win / count)}
+        for label, count, win in zip(labels, counts, wins) if count >= min_count
+    ]
+
+def summarize(lab, stats):
+    """Turn accumulators into report rows"""
+    stage_values = sorted(set(lab['stage'].tolist()))
+    stage_rounds = [stats['species_rounds'][lab['stage'] == s].sum() for s in stage_values]
+    stage_wins = [stats['species_wins'][lab['stage'] == s].sum() for s in stage_values]
+    type_rounds = lab['membership'].T.astype(float) @ stats['species_rounds']
+    type_wins = lab['membership'].T.astype(float) @ stats['species_wins']
+    bands = [f"{b * LEVEL_BAND}-{b * LEVEL_BAND + LEVEL_BAND - 1}" for b in range(len(stats['band_teams']))]
+
+    by_type = rate_rows(lab['type_names'], type_rounds, type_wins)
+    by_type.sort(key=lambda row: row['win_rate'], reverse=True)
+
+    return {
+        'battles': stats['battles'],
+        'first_team_win_rate': stats['a_wins'] / stats['battles'] if stats['battles'] else 0,
+        'by_legendary_count': rate_rows(range(TEAM_SIZE + 1), stats['legendary_teams'], stats['legendary_wins']),
+        'by_level_band': rate_rows(bands, stats['band_teams'], stats['band_wins']),
+        'by_type': by_type,
+        'by_stage': rate_rows(stage_values, stage_rounds, stage_wins)
+    }
+
+def print_report(summary, params, elapsed):
+    """Print the summary as plain text tables"""
+    print(f"{summary['battles']:,} battles in {elapsed:.1f}s | params: {params}")
+    print(f"First team win rate: {summary['first_team_win_rate'] * 100:.2f}% (should sit near 50%)")
+    sections = [
+        ('Team win rate by legendary count', 'by_legendary_count'),
+        ('Team win rate by average level band', 'by_level_band'),
+        ('Round win rate by type', 'by_type'),
+        ('Round win rate by evolution stage', 'by_stage')
+    ]
+    for title, key in sections:
+        print(f"\n{title}")
+        for row in summary[key]:
+            print(f"  {str(row['label']):>10}  {row['win_rate'] * 100:6.2f}%  ({row['samples']:,})")
+
+def main(argv=None):
+    defaults = default_params()
+    parser = argparse.ArgumentParser(description="Monte Carlo balance lab for the 5v5 battle engine")
+    parser.add_argument('--snapshot', default=refdata.SNAPSHOT_PATH, help="reference data snapshot to load")
+    parser.add_argument('--battles', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=200000)
+    parser.add_argument('--train', type=int, default=0, choices=[0, 1, 2], help="training sessions applied to every team")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', help="also write the summary as JSON to this path")
+    parser.add_argument('--level-rate', type=float, default=defaults['level_rate'])
+    parser.add_argument('--level-cap', type=float, default=defaults['level_cap'])
+    parser.add_argument('--legendary-power', type=float, default=defaults['legendary_power'])
+    parser.add_argument('--stage-power', type=float, default=defaults['stage_power'])
+    parser.add_argument('--type-bonus', type=float, default=defaults['type_bonus'])
+    parser.add_argument('--random-power', type=float, default=defaults['random_power'])
+    args = parser.parse_args(argv)
+
+    data = refdata.load_snapshot(args.snapshot)
+    if data is None:
+        parser.error(f"no snapshot at {args.snapshot} - run tools/refdata.py snapshot first")
+
+    params = {key: getattr(args, key) for key in defaults}
+    lab = build_lab_tables(data)
+
+    start = time.perf_counter()
+    stats = simulate(lab, params, args.battles, args.batch_size, args.train, args.seed)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(lab, stats)
+    print_report(summary, params, elapsed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'train_sessions': args.train, 'elapsed': elapsed, 'summary': summary}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+# bench_endpoints.py
+# Cold-start and request-latency benchmark for every api/ endpoint.
+#
+#   python tools/bench_endpoints.py --out bench.json
+#   python tools/bench_endpoints.py --compare bench.json --max-regression 20
+#
+# Each endpoint is measured in fresh Python processes (one per cold run):
+# module import time with a per-package breakdown from -X importtime, Firestore
+# client construction (only when FIREBASE_CREDS is set; nothing is sent), the
+# first request (which loads the reference cache) and warm request latency.
+# Requests run in-process against game.storage's in-memory stand-in seeded by
+# tools/fixtures.py, with the reference snapshot on disk like a deploy, so no
+# credentials or network are needed. Results are JSON, keyed by endpoint, and
+# --compare flags cold-start regressions against an earlier run.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+import harness
+
+IMPORT_MARKER = 'bench-endpoints: import done'
+
+# Metrics --compare checks for regressions
+COLD_METRICS = ['import_ms', 'first_request_ms']
+
+def request_params(name, i, species, trainers):
+    """Params for the i-th benchmark request to an endpoint"""
+    import fixtures
+
+    trainer = trainers[i % len(trainers)]
+    if name == 'pokecatch':
+        return fixtures.endpoint_params(f"bench{i:05d}")
+    if name == 'pokebattle':
+        return fixtures.endpoint_params(trainer, target='random')
+    if name == 'pokedex':
+        return fixtures.endpoint_params(trainer, pokemon=species[i % len(species)])
+    if name in ('pokeleaderclear', 'pokeleaderdelete'):
+        return fixtures.endpoint_params('jennetdaria', target=trainer)
+    return fixtures.endpoint_params(trainer)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def run_worker(name, warm, scale):
+    """Measure one endpoint in this (fresh) process and print the result as JSON"""
+    started = time.perf_counter()
+    module = harness.load_endpoint(name)
+    import_s = time.perf_counter() - started
+    sys.stderr.write(IMPORT_MARKER + '\n')
+    sys.stderr.flush()
+
+    import fixtures
+    from game import core, storage
+
+    client_s = None
+    if os.environ.get('FIREBASE_CREDS'):
+        # Builds the real client (credentials + gRPC channel setup) without any request
+        started = time.perf_counter()
+        core.get_db()
+        client_s = time.perf_counter() - started
+
+    db = storage.memory_client()
+    data = fixtures.reference_data()
+    fixtures.seed_reference(db, data)
+    trainers = fixtures.seed_game(db, data, **fixtures.SCALES[scale])
+    core.CLIENT = db
+    species = list(data['pokemon_data'])
+
+    db.ops.clear()
+    first = harness.call_endpoint(module, request_params(name, 0, species, trainers))
+    first_ops = dict(db.ops)
+
+    warm_s = []
+    db.ops.clear()
+    for i in range(1, warm + 1):
+        warm_s.append(harness.call_endpoint(module, request_params(name, i, species, trainers))['seconds'])
+    warm_ops = {op: count / max(1, warm) for op, count in db.ops.items()}
+
+    print(json.dumps({
+        'import_ms': import_s * 1000,
+        'client_ms': client_s * 1000 if client_s is not None else None,
+        'first_request_ms': first['seconds'] * 1000,
+        'first_status': first['status'],
+        'first_ops': first_ops,
+        'warm_p50_ms': percentile(warm_s, 50) * 1000 if warm_s else None,
+        'warm_p95_ms': percentile(warm_s, 95) * 1000 if warm_s else None,
+        'warm_ops_per_request': warm_ops
+    }))
+
+def parse_importtime(stderr, top=10):
+    """Per-package and per-module import times from -X importtime output"""
+    by_package = {}
+    by_module = []
+    for line in stderr.split('\n'):
+        if line.strip() == IMPORT_MARKER:
+            break
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = [part.strip() for part in line[len('import time:'):].split('|')]
+        package = module.split('.')[0]
+        by_package[package] = by_package.get(package, 0) + int(self_us) / 1000
+        by_module.append((module, int(cumulative_us) / 1000))
+
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    modules = sorted(by_module, key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'by_package_ms': {package: round(ms, 2) for package, ms in packages},
+        'top_modules_cumulative_ms': {module: round(ms, 2) for module, ms in modules}
+    }
+
+def bench_endpoint(name, args, env):
+    """Median of several cold runs of one endpoint, each in a new process"""
+    runs = []
+    breakdown = None
+    for _ in range(args.cold_runs):
+        command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--worker', name,
+                   '--warm', str(args.warm), '--scale', args.scale]
+        result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=ROOT_DIR)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} worker failed:\n{result.stderr[-2000:]}")
+        runs.append(json.loads(result.stdout.strip().split('\n')[-1]))
+        breakdown = breakdown or parse_importtime(result.stderr)
+
+    summary = dict(runs[-1])
+    for metric in ('import_ms', 'client_ms', 'first_request_ms', 'warm_p50_ms', 'warm_p95_ms'):
+        values = [run[metric] for run in runs if run[metric] is not None]
+        summary[metric] = round(statistics.median(values), 3) if values else None
+    summary['import_breakdown'] = breakdown
+    return summary
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=ROOT_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, max_regression):
+    """Print cold-start deltas against a baseline run; returns the regressions found"""
+    regressions = []
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for name, metrics in results['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if not old:
+            continue
+        deltas = []
+        for metric in COLD_METRICS:
+            if not old.get(metric) or metrics.get(metric) is None:
+                continue
+            change = (metrics[metric] - old[metric]) / old[metric] * 100
+            deltas.append(f"{metric} {old[metric]:.1f} -> {metrics[metric]:.1f} ({change:+.0f}%)")
+            if max_regression is not None and change > max_regression:
+                regressions.append((name, metric, change))
+        print(f"  {name:18} " + ' | '.join(deltas))
+    return regressions
+
+def print_report(results):
+    """Human-readable table of the results"""
+    print(f"{'endpoint':18} {'import ms':>10} {'client ms':>10} {'first ms':>10} {'warm p50':>10} {'warm p95':>10}  reads/writes per warm request")
+    for name, m in results['endpoints'].items():
+        client = f"{m['client_ms']:.1f}" if m['client_ms'] is not None else '-'
+        warm_ops = m['warm_ops_per_request']
+        print(f"{name:18} {m['import_ms']:10.1f} {client:>10} {m['first_request_ms']:10.1f} "
+              f"{m['warm_p50_ms'] or 0:10.2f} {m['warm_p95_ms'] or 0:10.2f}  "
+              f"{warm_ops.get('reads', 0):.1f}/{warm_ops.get('writes', 0):.1f}")
+    slowest = max(results['endpoints'].items(), key=lambda item: item[1]['import_ms'])
+    print(f"\nslowest import ({slowest[0]}) by package, ms: {slowest[1]['import_breakdown']['by_package_ms']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start and latency benchmark for the api/ endpoints")
+    parser.add_argument('--endpoints', help="comma-separated endpoint names (default: all)")
+    parser.add_argument('--cold-runs', type=int, default=3, help="fresh processes per endpoint; medians are reported")
+    parser.add_argument('--warm', type=int, default=50, help="warm requests per cold run")
+    parser.add_argument('--scale', choices=['small', 'medium', 'large'], default='small', help="size of the seeded game state")
+    parser.add_argument('--out', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="earlier results JSON to compare cold-start numbers against")
+    parser.add_argument('--max-regression', type=float, help="exit 1 if a cold metric got this many percent slower")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.warm, args.scale)
+        return
+
+    import fixtures
+    from game import refdata
+
+    names = args.endpoints.split(',') if args.endpoints else harness.endpoint_names()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cold starts read the bundled snapshot, as deployed; point them at one
+        # matching the seeded stand-in
+        env = dict(os.environ)
+        env['REFDATA_SNAPSHOT'] = os.path.join(tmp, 'reference_snapshot.json')
+        env['REQUEST_LOG'] = 'off'
+        refdata.write_snapshot(fixtures.reference_data(), env['REFDATA_SNAPSHOT'])
+
+        results = {
+            'commit': git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'scale': args.scale,
+            'cold_runs': args.cold_runs,
+            'warm_requests': args.warm,
+            'endpoints': {name: bench_endpoint(name, args, env) for name in names}
+        }
+
+    print_report(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            for name, metric, change in regressions:
+                print(f"REGRESSION: {name} {metric} {change:+.0f}%")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# fixtures.py
+# Synthetic reference data and game state for running the game locally.
+#
+# Builds a deterministic (seeded) species list with types, evolution chains and
+# pokedex text in the same layout as data/reference_snapshot.json, and seeds a
+# storage client (game.storage or Firestore) with it plus realistic game state:
+# a live stream's catches, the day's mod catches, leaderboard and legends.
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import core, pool, rankings, refdata
+
+# Channel the endpoints accept, and the uptime string of the seeded live stream
+CHANNEL = core.ALLOWED_CHANNEL
+STREAM_UPTIME = '2 hours 5 mins'
+
+# attacker -> types it's strong against
+TYPE_ADVANTAGES = {
+    'Normal': [],
+    'Fire': ['Grass', 'Ice', 'Bug', 'Steel'],
+    'Water': ['Fire', 'Ground', 'Rock'],
+    'Electric': ['Water', 'Flying'],
+    'Grass': ['Water', 'Ground', 'Rock'],
+    'Ice': ['Grass', 'Ground', 'Flying', 'Dragon'],
+    'Fighting': ['Normal', 'Ice', 'Rock', 'Dark', 'Steel'],
+    'Poison': ['Grass', 'Fairy'],
+    'Ground': ['Fire', 'Electric', 'Poison', 'Rock', 'Steel'],
+    'Flying': ['Grass', 'Fighting', 'Bug'],
+    'Psychic': ['Fighting', 'Poison'],
+    'Bug': ['Grass', 'Psychic', 'Dark'],
+    'Rock': ['Fire', 'Ice', 'Flying', 'Bug'],
+    'Ghost': ['Psychic', 'Ghost'],
+    'Dragon': ['Dragon'],
+    'Dark': ['Psychic', 'Ghost'],
+    'Steel': ['Ice', 'Rock', 'Fairy'],
+    'Fairy': ['Fighting', 'Dragon', 'Dark']
+}
+TYPES = list(TYPE_ADVANTAGES)
+
+SYLLABLES = ['ba', 'chu', 'da', 'ee', 'fla', 'go', 'ka', 'li', 'mon', 'nid', 'o', 'pi',
+             'ra', 'saur', 'ta', 'u', 'vee', 'wo', 'xa', 'zu', 'char', 'bul', 'squir', 'tle']
+
+WRITE_BATCH_SIZE = 400
+
+# seed_game sizes: a quiet stream, a typical one, and a raid on a long-running channel
+SCALES = {
+    'small': {'stream_trainers': 100, 'mod_trainers': 5, 'leaderboard': 200, 'legends': 1000},
+    'medium': {'stream_trainers': 500, 'mod_trainers': 10, 'leaderboard': 2000, 'legends': 20000},
+    'large': {'stream_trainers': 2000, 'mod_trainers': 20, 'leaderboard': 20000, 'legends': 100000}
+}
+
+def species_name(rng, taken):
+    """Unique pronounceable species name"""
+    while True:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        if name not in taken:
+            taken.add(name)
+            return name
+
+def reference_data(species=1025, legendaries=60, seed=1):
+    """Synthetic reference data in snapshot layout"""
+    rng = random.Random(seed)
+    taken = set()
+    pokemon_data = {}
+    names = []
+
+    while len(names) < species:
+        # Evolution chains of 1-3 stages sharing a type, some with a branch
+        stages = min(rng.choice([1, 2, 2, 3, 3]), species - len(names))
+        ptype = '/'.join(rng.sample(TYPES, rng.choice([1, 1, 2])))
+        chain = [species_name(rng, taken) for _ in range(stages)]
+        for stage, name in enumerate(chain, 1):
+            info = {
+                'type': ptype,
+                'stage': stage,
+                'species': f"{rng.choice(['Seed', 'Flame', 'Shell', 'Mouse', 'Bat', 'Fox'])} Pokemon",
+                'entry': ' '.join(rng.choice(SYLLABLES) for _ in range(rng.randint(20, 60))).capitalize() + '.',
+                'evolution': ' -> '.join(chain) if stages > 1 else 'No evolution',
+                'normalized_name': name.lower(),
+                'catch_level_min': 2 + 8 * (stage - 1),
+                'catch_level_max': 25 + 10 * (stage - 1)
+            }
+            if stage < stages:
+                info.update({
+                    'can_evolve': True,
+                    'can_train_evolve': True,
+                    'evolution_method': 'level-up',
+                    'evolves_to': chain[stage],
+                    'min_level_to_evolve': rng.choice([16, 18, 20, 22, 25, 30, 32, 36])
+                })
+            pokemon_data[name] = info
+        names.extend(chain)
+
+    legendary_list = rng.sample(names, min(legendaries, len(names)))
+    return {
+        'format': refdata.SNAPSHOT_FORMAT,
+        'versions': {section: 1 for section in refdata.ALL_SECTIONS},
+        'pokemon_data': pokemon_data,
+        'game_config': {
+            'legendaries': {'list': legendary_list},
+            'type_advantages': {'data': TYPE_ADVANTAGES},
+            'spawn_weights': {}
+        }
+    }
+
+def write_all(db, docs):
+    """Set (ref, data) pairs in batches"""
+    docs = list(docs)
+    for start in range(0, len(docs), WRITE_BATCH_SIZE):
+        batch = db.batch()
+        for ref, data in docs[start:start + WRITE_BATCH_SIZE]:
+            batch.set(ref, data)
+        batch.commit()
+
+def seed_reference(db, data):
+    """Write reference data (species, game_config and version stamps) to a client"""
+    docs = [(db.collection('pokemon_data').document(name), info) for name, info in data['pokemon_data'].items()]
+    docs += [(db.collection('game_config').document(section), doc) for section, doc in data['game_config'].items()]
+    docs.append((db.collection('game_config').document('versions'), dict(data['versions'])))
+    write_all(db, docs)
+
+def random_team(rng, names):
+    """Five caught species with levels"""
+    return rng.sample(names, 5), [rng.randint(5, 45) for _ in range(5)]
+
+def stats_doc(rng, max_battles):
+    """Leaderboard/legends totals, as already counted by the rank index"""
+    battles = rng.randint(1, max_battles)
+    wins = rng.randint(0, battles)
+    return {'total_battles': battles, 'total_wins': wins, 'total_losses': battles - wins, 'rank_key': [wins, battles]}
+
+def seed_game(db, data, stream_trainers=500, mod_trainers=10, leaderboard=2000, legends=20000, seed=1):
+    """Write realistic game state: live stream catches, mod dailies and rankings stats
+
+    The !pokerank indexes are built too, as tools/rank_index.py would on a deploy.
+    Returns the seeded trainer names (stream trainers first).
+    """
+    rng = random.Random(seed)
+    names = list(data['pokemon_data'])
+    trainers = [f"viewer{i:05d}" for i in range(max(stream_trainers, leaderboard, legends))]
+
+    stream_ref = db.collection('catches').document(core.stream_id(CHANNEL, STREAM_UPTIME))
+    daily_ref = db.collection('mod_daily').document(core.mod_daily_id())
+    docs = []
+    available = []
+    for trainer in trainers[:stream_trainers]:
+        pokemon, levels = random_team(rng, names)
+        battles_used = rng.choice([0, 0, 0, 1, 2])
+        docs.append((stream_ref.collection('users').document(trainer), {
+            'pokemon': pokemon,
+            'levels': levels,
+            'catch_count': rng.choice([1, 2]),
+            'battles_used': battles_used,
+            'training_used': rng.choice([0, 1, 2])
+        }))
+        if battles_used < 2:
+            available.append(trainer)
+    for shard, doc in pool.shard_docs(available).items():
+        docs.append((pool.shard_ref(stream_ref, shard), doc))
+
+    for i in range(mod_trainers):
+        pokemon, levels = random_team(rng, names)
+        docs.append((daily_ref.collection('users').document(f"mod{i:02d}"), {'pokemon': pokemon, 'levels': levels, 'catch_count': 1}))
+
+    docs += [(db.collection('leaderboard').document(t), stats_doc(rng, 40)) for t in trainers[:leaderboard]]
+    docs += [(db.collection('legends').document(t), stats_doc(rng, 400)) for t in trainers[:legends]]
+    write_all(db, docs)
+    for collection in rankings.MIN_BATTLES:
+        rankings.rebuild_rank_index(db, collection)
+    return trainers
+
+def endpoint_params(user, user_level='regular', uptime=STREAM_UPTIME, **extra):
+    """Query params the chatbot sends for a command"""
+    params = {'channel': CHANNEL, 'user': user, 'uptime': uptime, 'user_level': user_level}
+    params.update(extra)
+    return params
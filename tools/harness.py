@@ -0,0 +1,70 @@
+# harness.py
+# Load api/ endpoints as modules and call their handlers in-process.
+#
+# The handlers are BaseHTTPRequestHandler subclasses; call_endpoint builds one
+# around an in-memory request instead of a socket and returns what it wrote.
+import importlib.util
+import io
+import os
+import time
+import urllib.parse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT_DIR, 'api')
+
+def endpoint_names():
+    """Every endpoint module in api/"""
+    return sorted(f[:-3] for f in os.listdir(API_DIR) if f.endswith('.py') and not f.startswith('_'))
+
+def load_endpoint(name):
+    """Import api/{name}.py as a module"""
+    spec = importlib.util.spec_from_file_location(f"api_{name}", os.path.join(API_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_server_timing(value):
+    """Server-Timing header -> {metric: {'dur': ms, 'desc': text}}"""
+    metrics = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        name, *fields = [field.strip() for field in entry.split(';')]
+        metric = {}
+        for field in fields:
+            key, _, val = field.partition('=')
+            metric[key] = float(val) if key == 'dur' else val.strip('"')
+        metrics[name] = metric
+    return metrics
+
+def call_endpoint(module, params, headers=None):
+    """Run one GET through an endpoint's handler
+
+    Returns {'status', 'headers', 'body', 'seconds', 'timing'}, timing being
+    the parsed Server-Timing header.
+    """
+    handler = module.handler.__new__(module.handler)
+    handler.path = f"/api/{module.__name__[4:]}?{urllib.parse.urlencode(params)}"
+    handler.command = 'GET'
+    handler.request_version = 'HTTP/1.1'
+    handler.requestline = f"GET {handler.path} HTTP/1.1"
+    handler.client_address = ('127.0.0.1', 0)
+    handler.headers = dict(headers or {})
+    handler.wfile = io.BytesIO()
+    handler.log_message = lambda *args: None
+
+    started = time.perf_counter()
+    handler.do_GET()
+    seconds = time.perf_counter() - started
+
+    head, _, body = handler.wfile.getvalue().partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    response_headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(':')
+        response_headers[key.strip()] = value.strip()
+    return {
+        'status': int(lines[0].split()[1]) if lines and lines[0] else 0,
+        'headers': response_headers,
+        'body': body.decode('utf-8', 'replace'),
+        'seconds': seconds,
+        'timing': parse_server_timing(response_headers.get('Server-Timing', ''))
+    }
@@ -0,0 +1,273 @@
+# loadgen.py
+# Chat-burst load generator: replays StreamElements-style command traffic
+# against the api/ handler classes and reports latency percentiles.
+#
+#   python tools/loadgen.py                                  # a 500-viewer raid
+#   python tools/loadgen.py --viewers 1000 --window 20 --concurrency 100
+#   python tools/loadgen.py --scenario mix --mix pokecatch=4,pokebattle=3,mypokemon=2,pokeleaders=1
+#   python tools/loadgen.py --storage sqlite:game.db --snapshot game.snapshot.json
+#
+# raid: each raider types !pokecatch at a random moment in the first part of
+# the window, then !pokebattle random a few seconds after their catch answered.
+# mix: each viewer sends --commands weighted picks from --mix over the window.
+#
+# Every command is a GET with the query params the chatbot sends (channel,
+# user, uptime, user_level, plus the command's own). Requests run on a pool of
+# --concurrency threads in this process, standing in for concurrent function
+# instances; note they share the process's warm caches and the GIL, so this
+# is a warm-instance burst, not a cold-start test (see bench_endpoints.py).
+# A viewer's commands run in order, never overlapping, as in chat.
+#
+# Storage is the in-memory stand-in seeded from tools/fixtures.py (--scale), or
+# a database prepared by seed_storage.py. Reported per command: p50/p95/p99 of
+# handler time and of response time (scheduled -> answered, including queueing
+# when the pool is saturated), throughput, error rate and backend reads,
+# writes and round trips per request.
+import argparse
+import heapq
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+import harness
+
+# StreamElements ${user.level} values and how often a viewer has each
+USER_LEVELS = [('regular', 0.80), ('subscriber', 0.12), ('vip', 0.05), ('moderator', 0.03)]
+
+# Seconds between a raider's catch answer and their !pokebattle
+BATTLE_DELAY = (2.0, 8.0)
+
+# Part of the window in which raiders send their first command
+RAID_ARRIVAL = 0.6
+
+DEFAULT_MIX = 'pokecatch=4,pokebattle=3,mypokemon=2,poketrain=1,pokerank=1,pokeleaders=1,pokelegends=1,pokedex=1'
+
+def parse_mix(text):
+    """'pokecatch=4,pokebattle=3' -> [('pokecatch', 4.0), ('pokebattle', 3.0)]"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+def command_params(command, user, user_level, uptime, species, rng):
+    """Query params for one chat command"""
+    import fixtures
+
+    extra = {}
+    if command == 'pokebattle':
+        extra['target'] = 'random'
+    elif command == 'pokedex':
+        extra['pokemon'] = rng.choice(species)
+    return fixtures.endpoint_params(user, user_level=user_level, uptime=uptime, **extra)
+
+def raid_sessions(args, species, rng):
+    """Each raider: (at, !pokecatch) then !pokebattle random"""
+    sessions = []
+    for i in range(args.viewers):
+        user = f"raider{i:05d}"
+        level = pick_level(rng)
+        at = rng.uniform(0, args.window * RAID_ARRIVAL)
+        sessions.append([
+            (at, 'pokecatch', command_params('pokecatch', user, level, args.uptime, species, rng)),
+            (rng.uniform(*BATTLE_DELAY), 'pokebattle', command_params('pokebattle', user, level, args.uptime, species, rng))
+        ])
+    return sessions
+
+def mix_sessions(args, trainers, species, rng):
+    """Each viewer: --commands weighted picks spread over the window"""
+    mix = parse_mix(args.mix)
+    names, weights = [name for name, _ in mix], [weight for _, weight in mix]
+    sessions = []
+    for i in range(args.viewers):
+        user = trainers[i % len(trainers)] if i < len(trainers) else f"viewer{i:05d}"
+        level = pick_level(rng)
+        times = sorted(rng.uniform(0, args.window) for _ in range(args.commands))
+        steps = []
+        previous = 0.0
+        for at, command in zip(times, rng.choices(names, weights, k=args.commands)):
+            # First step: absolute time; later steps: delay after the previous answer
+            steps.append((at - previous if steps else at, command, command_params(command, user, level, args.uptime, species, rng)))
+            previous = at
+        sessions.append(steps)
+    return sessions
+
+def pick_level(rng):
+    levels, weights = zip(*USER_LEVELS)
+    return rng.choices(levels, weights)[0]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def run_load(sessions, modules, client, concurrency, speed):
+    """Play the sessions against the handlers; returns one record per request
+
+    Step times are scaled by 1/speed; speed 0 sends everything as fast as the
+    pool takes it (keeping each viewer's commands in order).
+    """
+    scale = 0 if speed == 0 else 1 / speed
+    records = []
+    lock = threading.Lock()
+    due = [(steps[0][0] * scale, index, 0) for index, steps in enumerate(sessions)]
+    heapq.heapify(due)
+    pending = [0]
+    wakeup = threading.Condition(lock)
+    started = time.perf_counter()
+
+    def run_step(index, step, scheduled):
+        _, command, params = sessions[index][step]
+        record = {'command': command, 'scheduled': scheduled}
+        try:
+            with client.tracking() as ops:
+                result = harness.call_endpoint(modules[command], params)
+            phases = {name: metric['dur'] for name, metric in result['timing'].items() if name not in ('db', 'total')}
+            record.update(status=result['status'], seconds=result['seconds'], ops=dict(ops), phases=phases)
+        except Exception as e:
+            record.update(status=0, seconds=0.0, ops={}, phases={}, error=f"{type(e).__name__}: {e}")
+        record['answered'] = time.perf_counter() - started
+        with lock:
+            records.append(record)
+            pending[0] -= 1
+            if step + 1 < len(sessions[index]):
+                delay = sessions[index][step + 1][0] * scale
+                heapq.heappush(due, (record['answered'] + delay, index, step + 1))
+            wakeup.notify()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        with lock:
+            while due or pending[0]:
+                if not due:
+                    wakeup.wait()
+                    continue
+                at, index, step = due[0]
+                wait = at - (time.perf_counter() - started)
+                if wait > 0:
+                    wakeup.wait(wait)
+                    continue
+                heapq.heappop(due)
+                pending[0] += 1
+                pool.submit(run_step, index, step, at)
+
+    return records, time.perf_counter() - started
+
+def summarize(records, elapsed):
+    """Per-command and overall latency, throughput, errors and backend ops"""
+    by_command = defaultdict(list)
+    for record in records:
+        by_command[record['command']].append(record)
+    by_command['all'] = records
+
+    summary = {}
+    for command, group in by_command.items():
+        handler_ms = [r['seconds'] * 1000 for r in group]
+        response_ms = [(r['answered'] - r['scheduled']) * 1000 for r in group]
+        ops = Counter()
+        phases = Counter()
+        for r in group:
+            ops.update(r['ops'])
+            phases.update(r['phases'])
+        errors = [r for r in group if r['status'] != 200]
+        summary[command] = {
+            'requests': len(group),
+            'errors': len(errors),
+            'error_rate': len(errors) / len(group),
+            'statuses': dict(Counter(r['status'] for r in group)),
+            'throughput_rps': len(group) / elapsed if elapsed else None,
+            'handler_ms': {f"p{p}": round(percentile(handler_ms, p), 3) for p in (50, 95, 99)},
+            'response_ms': {f"p{p}": round(percentile(response_ms, p), 3) for p in (50, 95, 99)},
+            'max_response_ms': round(max(response_ms), 3),
+            'mean_handler_ms': round(statistics.mean(handler_ms), 3),
+            'ops_per_request': {op: round(count / len(group), 2) for op, count in sorted(ops.items())},
+            # Mean ms per request spent in each instrumented phase (Server-Timing)
+            'phase_ms_per_request': {name: round(ms / len(group), 3) for name, ms in phases.most_common()},
+            'sample_errors': sorted({r.get('error') or f"HTTP {r['status']}" for r in errors})[:5]
+        }
+    return summary
+
+def print_report(summary, elapsed, args):
+    print(f"{args.scenario}: {summary['all']['requests']} requests from {args.viewers} viewers in {elapsed:.1f}s, "
+          f"concurrency {args.concurrency}, storage {args.storage}")
+    print(f"{'command':14} {'reqs':>6} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'resp p99':>9}  reads/writes/rtt per req")
+    for command, s in sorted(summary.items(), key=lambda item: item[0] == 'all'):
+        ops = s['ops_per_request']
+        print(f"{command:14} {s['requests']:6} {s['error_rate'] * 100:6.1f} {s['throughput_rps']:7.1f} "
+              f"{s['handler_ms']['p50']:8.2f} {s['handler_ms']['p95']:8.2f} {s['handler_ms']['p99']:8.2f} "
+              f"{s['response_ms']['p99']:9.1f}  {ops.get('reads', 0):.1f}/{ops.get('writes', 0):.1f}/{ops.get('round_trips', 0):.1f}")
+        if command != 'all' and s['phase_ms_per_request']:
+            print(f"{'':14}   phases: " + ', '.join(f"{name} {ms:.2f}" for name, ms in s['phase_ms_per_request'].items()))
+        for error in s['sample_errors']:
+            print(f"{'':14} ! {error}")
+    print("(latencies in ms; p50-p99 are handler time, resp includes queueing)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a burst of chat commands against the api/ handlers")
+    parser.add_argument('--scenario', choices=['raid', 'mix'], default='raid')
+    parser.add_argument('--viewers', type=int, default=500)
+    parser.add_argument('--window', type=float, default=30.0, help="seconds the burst is spread over")
+    parser.add_argument('--speed', type=float, default=1.0, help="time compression; 0 = no pauses")
+    parser.add_argument('--concurrency', type=int, default=50, help="requests in flight at once")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="command=weight,... for --scenario mix")
+    parser.add_argument('--commands', type=int, default=3, help="commands per viewer for --scenario mix")
+    parser.add_argument('--uptime', help="uptime param (default: the seeded stream; 'offline' for mod play)")
+    parser.add_argument('--storage', default='memory', help="memory (seeded here) or sqlite:PATH from seed_storage.py")
+    parser.add_argument('--snapshot', help="reference snapshot matching --storage (seed_storage.py writes one)")
+    parser.add_argument('--scale', default='medium', help="fixtures scale for --storage memory")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help="write the summary as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # Endpoints read the reference snapshot path and log setting at import, so they're set first
+    os.environ.setdefault('REQUEST_LOG', 'off')
+    tmp = tempfile.TemporaryDirectory()
+    if args.snapshot:
+        os.environ['REFDATA_SNAPSHOT'] = os.path.abspath(args.snapshot)
+    elif args.storage == 'memory':
+        os.environ['REFDATA_SNAPSHOT'] = os.path.join(tmp.name, 'reference_snapshot.json')
+
+    import fixtures
+    from game import core, refdata, storage
+
+    rng = random.Random(args.seed)
+    client = storage.open_client(args.storage)
+    if args.storage == 'memory':
+        data = fixtures.reference_data(seed=args.seed)
+        refdata.write_snapshot(data, os.environ['REFDATA_SNAPSHOT'])
+        fixtures.seed_reference(client, data)
+        trainers = fixtures.seed_game(client, data, seed=args.seed, **fixtures.SCALES[args.scale])
+        species = list(data['pokemon_data'])
+    else:
+        trainers = [doc.id for doc in client.collection('legends').select([]).stream()]
+        species = [doc.id for doc in client.collection('pokemon_data').select([]).stream()]
+    core.CLIENT = client
+    args.uptime = args.uptime or fixtures.STREAM_UPTIME
+
+    if args.scenario == 'raid':
+        sessions = raid_sessions(args, species, rng)
+    else:
+        sessions = mix_sessions(args, trainers, species, rng)
+    modules = {name: harness.load_endpoint(name) for name in {step[1] for steps in sessions for step in steps}}
+
+    records, elapsed = run_load(sessions, modules, client, args.concurrency, args.speed)
+    summary = summarize(records, elapsed)
+    print_report(summary, elapsed, args)
+    tmp.cleanup()
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'elapsed_seconds': elapsed, 'commands': summary}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
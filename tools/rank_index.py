@@ -0,0 +1,65 @@
+# rank_index.py
+# Build the !pokerank indexes from a full scan of leaderboard and legends.
+#
+#   FIREBASE_CREDS='{...}' python tools/rank_index.py rebuild
+#   FIREBASE_CREDS='{...}' python tools/rank_index.py rebuild legends
+#   FIREBASE_CREDS='{...}' python tools/rank_index.py drain
+#
+# Run it once when deploying the index, and again if it's ever suspected to
+# have drifted. While a collection is rebuilding, !pokerank answers "rank
+# unavailable" for it; draining the battle queue keeps the finished index
+# current afterwards. The standings commands drain as they're used; `drain`
+# empties the whole queue, e.g. after a burst of battles nobody looked at.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import rankings
+
+def get_db():
+    """Connect to Firestore with the same credentials the endpoints use"""
+    from game import core
+    return core.get_db()
+
+def cmd_rebuild(args):
+    """Rebuild the rank index of each given collection"""
+    db = get_db()
+    for collection in args.collections or list(rankings.MIN_BATTLES):
+        started = time.perf_counter()
+        rankings.rebuild_rank_index(db, collection)
+        print(f"Rebuilt {collection} rank index in {time.perf_counter() - started:.1f}s")
+
+def cmd_drain(args):
+    """Apply every queued battle result to the top lists and rank indexes"""
+    db = get_db()
+    started = time.perf_counter()
+    total = 0
+    while True:
+        drained = rankings.drain_rank_queue(db)
+        if not drained:
+            break
+        total += drained
+    print(f"Drained {total} queued trainers in {time.perf_counter() - started:.1f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="!pokerank index tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser('rebuild', help="rebuild rank indexes from a full scan")
+    rebuild_parser.add_argument('collections', nargs='*', help=f"any of {', '.join(rankings.MIN_BATTLES)} (default: all)")
+    rebuild_parser.set_defaults(func=cmd_rebuild)
+
+    drain_parser = subparsers.add_parser('drain', help="apply all queued battle results")
+    drain_parser.set_defaults(func=cmd_drain)
+
+    args = parser.parse_args(argv)
+    unknown = [c for c in getattr(args, 'collections', []) if c not in rankings.MIN_BATTLES]
+    if unknown:
+        parser.error(f"unknown collection: {', '.join(unknown)}")
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
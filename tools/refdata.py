@@ -0,0 +1,62 @@
+# refdata.py
+# Build the reference data snapshot bundled with the serverless functions.
+#
+#   FIREBASE_CREDS='{...}' python tools/refdata.py snapshot
+#
+# Every deploy runs this as its build command (vercel.json), with FIREBASE_CREDS
+# set for the build, and bundles data/reference_snapshot.json with each
+# function, so a deploy always ships a fresh snapshot. A failed snapshot fails
+# the build rather than shipping functions that would cold-start from Firestore.
+#
+#   FIREBASE_CREDS='{...}' python tools/refdata.py bump type_advantages
+#
+# Bumps the section's stamp in game_config/versions so warm instances pick up
+# the edit within VERSION_CHECK_TTL seconds, without a redeploy.
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import refdata
+
+def get_db():
+    """Connect to Firestore with the same credentials the endpoints use"""
+    from game import core
+    return core.get_db()
+
+def cmd_snapshot(args):
+    """Write a fresh snapshot of every reference data section"""
+    data = refdata.build_snapshot(get_db())
+    refdata.write_snapshot(data, args.out)
+    size_kb = os.path.getsize(args.out) / 1024
+    print(f"Wrote {len(data['pokemon_data'])} species to {args.out} ({size_kb:.1f} KB)")
+    print(f"Versions: {data['versions']}")
+
+def cmd_bump(args):
+    """Increment the version stamp of the given sections"""
+    from firebase_admin import firestore
+    
+    db = get_db()
+    db.collection('game_config').document('versions').set(
+        {section: firestore.Increment(1) for section in args.sections}, merge=True
+    )
+    print(f"Bumped {', '.join(args.sections)}: {refdata.fetch_versions(db)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference data snapshot tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    snapshot_parser = subparsers.add_parser('snapshot', help="build data/reference_snapshot.json from Firestore")
+    snapshot_parser.add_argument('--out', default=refdata.SNAPSHOT_PATH, help="output path")
+    snapshot_parser.set_defaults(func=cmd_snapshot)
+    
+    bump_parser = subparsers.add_parser('bump', help="mark sections as changed in game_config/versions")
+    bump_parser.add_argument('sections', nargs='+', choices=refdata.ALL_SECTIONS)
+    bump_parser.set_defaults(func=cmd_bump)
+    
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# seed_storage.py
+# Seed a local storage stand-in with reference data and realistic game state.
+#
+#   python tools/seed_storage.py sqlite:game.db --scale medium
+#
+# writes species, game_config, a live stream's catches/{stream_id}/users, the
+# day's mod_daily session, leaderboard and legends, plus the matching reference
+# snapshot (default: next to the database). Then run anything against it with
+#
+#   GAME_STORAGE=sqlite:game.db REFDATA_SNAPSHOT=game.snapshot.json ...
+#
+# Requests need uptime=fixtures.STREAM_UPTIME to land on the seeded stream.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from game import rankings, refdata, storage
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a local storage stand-in with game data")
+    parser.add_argument('storage', help="sqlite:PATH (memory is only useful in-process)")
+    parser.add_argument('--scale', choices=list(fixtures.SCALES), default='medium')
+    parser.add_argument('--species', type=int, default=1025)
+    parser.add_argument('--seed', type=int, default=1, help="random seed; the same seed gives the same data")
+    parser.add_argument('--snapshot', help="where to write the reference snapshot")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    db = storage.open_client(args.storage)
+    data = fixtures.reference_data(species=args.species, seed=args.seed)
+    fixtures.seed_reference(db, data)
+    trainers = fixtures.seed_game(db, data, seed=args.seed, **fixtures.SCALES[args.scale])
+    for collection in rankings.MIN_BATTLES:
+        rankings.rebuild_rankings(db, collection)
+
+    snapshot = args.snapshot
+    if snapshot is None:
+        base = args.storage.split(':', 1)[1] if ':' in args.storage else 'game'
+        snapshot = os.path.splitext(base)[0] + '.snapshot.json'
+    refdata.write_snapshot(data, snapshot)
+
+    print(f"Seeded {args.storage} ({args.scale}): {len(data['pokemon_data'])} species, "
+          f"{len(trainers)} trainers, {db.ops['writes']} writes in {time.perf_counter() - started:.1f}s")
+    print(f"Reference snapshot: {snapshot}")
+    print(f"Stream uptime: {fixtures.STREAM_UPTIME!r}")
+
+if __name__ == '__main__':
+    main()